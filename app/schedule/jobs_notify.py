@@ -1,21 +1,24 @@
 from __future__ import annotations
 
 import logging
-import os
 from typing import Iterable
 
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
-from dotenv import load_dotenv
 from zoneinfo import ZoneInfo
 
+from src.fiin_alerts.config import TIMEZONE
 from src.fiin_alerts.jobs.generate_and_send_alerts import run_once
 from src.fiin_alerts.logging import setup as setup_logging
-
-load_dotenv()
+from src.fiin_alerts.signals.v4_robust import warm_up_kernels as warm_up_v4_kernels
+from src.fiin_alerts.signals.v12_strategy import warm_up_kernels
 
 LOG = logging.getLogger(__name__)
-_TZ = ZoneInfo(os.getenv("TIMEZONE", "Asia/Ho_Chi_Minh"))
+_TZ = ZoneInfo(TIMEZONE)
+# Jobs (and their blocking Gmail/FiinQuant I/O) run on this pool, never on the
+# scheduler loop; four workers cover an overrunning tick overlapping the next.
+_JOB_WORKERS = 4
 
 
 def run_signals_and_notify(
@@ -38,7 +41,13 @@ def run_signals_and_notify(
 
 def _start_scheduler() -> None:
     setup_logging()
-    scheduler = BlockingScheduler(timezone=_TZ)
+    # Compile (or load cached) numba kernels now rather than in the first tick.
+    warm_up_kernels()
+    warm_up_v4_kernels()
+    scheduler = BlockingScheduler(
+        timezone=_TZ,
+        executors={"default": ThreadPoolExecutor(max_workers=_JOB_WORKERS)},
+    )
     intraday_schedules = [
         ("notify_am", {"hour": "9-10", "minute": "*/15"}),
         ("notify_late_morning", {"hour": 11, "minute": "0,15,30"}),
@@ -1,65 +1,143 @@
 from __future__ import annotations
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import logging
 
+try:  # optional vendor SDK; resolved once at import instead of on every fetch
+    import FiinQuantX as fq
+except Exception:  # pragma: no cover - depends on the environment
+    fq = None
+
 LOG = logging.getLogger(__name__)
+_FETCH_ATTEMPTS = 3
+_RETRY_BASE_SECONDS = 1.0
+_MAX_BACKOFF_SECONDS = 8.0
+_RNG = random.Random()  # private, urandom-seeded jitter source
+_CHUNK_SIZE = 10  # tickers per Fetch_Trading_Data request
+_MAX_WORKERS = 8
+# Specific enough that ordinary parse errors ("Unexpected token ...") do not
+# trigger a re-login.
+_AUTH_ERROR_HINTS = (
+    "unauthor", "authentic", "401", "login", "expired",
+    "invalid token", "token is invalid", "access token", "refresh token",
+)
 
-def fetch_intraday(username: str, password: str, tickers: list[str], minutes: int = 10, by: str = "1m") -> pd.DataFrame:
-    try:
-        import FiinQuantX as fq
-    except Exception:
-        LOG.warning("FiinQuantX not installed; skipping realtime fetch.")
-        return pd.DataFrame()
+# Idle logged-in clients keyed by credentials. The scheduler calls
+# fetch_intraday() every 15 minutes, and login costs an extra HTTPS round trip
+# each time. Nothing shows FiinSession clients are safe to share between
+# threads, so each fetch worker checks one out for its own use (logging in a
+# new one when none is idle) and hands it back afterwards.
+_IDLE_CLIENTS: dict[tuple[str, str], list] = {}
+_CLIENT_POOL_SIZE = _MAX_WORKERS
+_CLIENT_LOCK = threading.Lock()
 
-    # 1) Login
-    client = fq.FiinSession(username=username, password=password).login()
-    
-    # 2) Time range
-    from datetime import datetime, timedelta
-    since = (datetime.now() - timedelta(minutes=minutes)).strftime("%Y-%m-%d %H:%M")
+def _login(username: str, password: str):
+    return fq.FiinSession(username=username, password=password).login()
+
+def _checkout_client(username: str, password: str):
+    with _CLIENT_LOCK:
+        idle = _IDLE_CLIENTS.get((username, password))
+        if idle:
+            return idle.pop()
+    return _login(username, password)
+
+def _checkin_client(username: str, password: str, client) -> None:
+    with _CLIENT_LOCK:
+        idle = _IDLE_CLIENTS.setdefault((username, password), [])
+        if len(idle) < _CLIENT_POOL_SIZE:
+            idle.append(client)
+
+def _is_auth_error(exc: Exception) -> bool:
+    text = f"{type(exc).__name__} {exc}".lower()
+    return any(hint in text for hint in _AUTH_ERROR_HINTS)
+
+def _fetch_chunk(username: str, password: str, tickers: list[str], by: str, since: str) -> pd.DataFrame:
+    # Login (pooled across calls); this worker owns the client until it is handed back.
+    client = _checkout_client(username, password)
 
     last_exc: Exception | None = None
     raw = None
-    for attempt in range(3):
-        try:
-            raw = client.Fetch_Trading_Data(
-                realtime=False,
-                tickers=tickers,
-                fields=["open","high","low","close","volume","bu","sd","fb","fs","fn"],
-                adjusted=True,
-                by=by,
-                from_date=since,
-            ).get_data()
-            break
-        except Exception as exc:
-            last_exc = exc
-            LOG.warning("FiinQuant Fetch_Trading_Data failed (attempt %s): %s", attempt + 1, exc)
-            time.sleep(1.0 * (attempt + 1))
-    else:
-        if last_exc is not None:
-            LOG.warning("FiinQuant fetch failed after retries: %s", last_exc)
+    try:
+        for attempt in range(_FETCH_ATTEMPTS):
+            try:
+                raw = client.Fetch_Trading_Data(
+                    realtime=False,
+                    tickers=tickers,
+                    fields=["open","high","low","close","volume","bu","sd","fb","fs","fn"],
+                    adjusted=True,
+                    by=by,
+                    from_date=since,
+                ).get_data()
+                break
+            except Exception as exc:
+                last_exc = exc
+                LOG.warning("FiinQuant Fetch_Trading_Data failed (attempt %s): %s", attempt + 1, exc)
+                if _is_auth_error(exc):
+                    # This session expired; drop it and log in again before the next attempt.
+                    client = None
+                    try:
+                        client = _login(username, password)
+                    except Exception as login_exc:
+                        LOG.warning("FiinQuant re-login failed: %s", login_exc)
+                        break
+                if attempt + 1 < _FETCH_ATTEMPTS:
+                    time.sleep(_RNG.uniform(0, min(_RETRY_BASE_SECONDS * 2 ** attempt, _MAX_BACKOFF_SECONDS)))
+        else:
+            if last_exc is not None:
+                LOG.warning("FiinQuant fetch failed after retries: %s", last_exc)
+    finally:
+        if client is not None:
+            _checkin_client(username, password, client)
 
     # ---- Normalize to DataFrame (no boolean context on DataFrame!) ----
-    df: pd.DataFrame
     if raw is None:
-        df = pd.DataFrame()
-    elif isinstance(raw, pd.DataFrame):
-        df = raw.copy()
-    elif isinstance(raw, (list, tuple)):
-        df = pd.DataFrame(raw)
-    elif isinstance(raw, dict):
+        return pd.DataFrame()
+    if isinstance(raw, pd.DataFrame):
+        # get_data() hands back a fresh frame that nothing else holds; normalise in place.
+        return raw
+    if isinstance(raw, (list, tuple)):
+        return pd.DataFrame(raw)
+    if isinstance(raw, dict):
         payload = raw.get("data") or raw.get("Data") or raw.get("items") or raw.get("Items")
-        df = pd.DataFrame(payload or [])
+        return pd.DataFrame(payload or [])
+    LOG.warning("Unknown data type from FiinQuantX: %s", type(raw))
+    return pd.DataFrame()
+
+def fetch_intraday(username: str, password: str, tickers: list[str], minutes: int = 10, by: str = "1m") -> pd.DataFrame:
+    if fq is None:
+        LOG.warning("FiinQuantX not installed; skipping realtime fetch.")
+        return pd.DataFrame()
+
+    # Time range
+    from datetime import datetime, timedelta
+    since = (datetime.now() - timedelta(minutes=minutes)).strftime("%Y-%m-%d %H:%M")
+
+    tickers = list(tickers)
+    if len(tickers) <= _CHUNK_SIZE:
+        df = _fetch_chunk(username, password, tickers, by, since)
     else:
-        LOG.warning("Unknown data type from FiinQuantX: %s", type(raw))
-        df = pd.DataFrame()
+        # The request is network-bound and its latency grows with the ticker
+        # count, so fetch small chunks side by side (socket reads release the GIL).
+        chunks = [tickers[i:i + _CHUNK_SIZE] for i in range(0, len(tickers), _CHUNK_SIZE)]
+        with ThreadPoolExecutor(max_workers=min(_MAX_WORKERS, len(chunks)), thread_name_prefix="fiinquant") as pool:
+            frames = list(pool.map(lambda chunk: _fetch_chunk(username, password, chunk, by, since), chunks))
+        frames = [f for f in frames if not f.empty]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
     # ---- Ensure time column exists & is datetime ----
     if "time" in df.columns:
-        df["time"] = pd.to_datetime(df["time"], errors="coerce")
+        if not pd.api.types.is_datetime64_any_dtype(df["time"]):
+            df["time"] = pd.to_datetime(df["time"], errors="coerce")
     elif "timestamp" in df.columns:
         # nhiều API trả millis
-        df["time"] = pd.to_datetime(df["timestamp"], unit="ms", errors="coerce")
+        ts = df["timestamp"]
+        if ts.dtype == "int64":
+            # int64 epoch millis cannot hold NaN, so reinterpret the buffer directly
+            df["time"] = ts.to_numpy(dtype="int64").view("datetime64[ms]")
+        else:
+            df["time"] = pd.to_datetime(ts, unit="ms", errors="coerce")
 
     return df
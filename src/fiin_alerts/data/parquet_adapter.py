@@ -1,12 +1,238 @@
 from __future__ import annotations
+import datetime as dt, logging, os, threading
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
 from pathlib import Path
+from typing import Iterable
 
-def load_recent_from_parquet(path: str, rows: int = 5000) -> pd.DataFrame:
+LOG = logging.getLogger(__name__)
+
+# Uncompressed Arrow IPC copy of the last rows read from a parquet file. The
+# intraday job asks for the same tail every few minutes, and mapping this file
+# is far cheaper than decoding parquet row groups again.
+_TAIL_CACHE_SUFFIX = ".tail.arrow"
+_META_SOURCE = b"fiin_alerts.source"
+_META_ROWS = b"fiin_alerts.rows"
+_META_COLUMNS = b"fiin_alerts.columns"
+
+def as_ticker_category(tickers: pd.Series) -> pd.Series:
+    """Return tickers as a Categorical with lexically sorted categories.
+
+    Group-bys then work on integer codes instead of hashing ticker strings per
+    row, and sorting by ticker gives the same order as the plain string column.
+    """
+    if not isinstance(tickers.dtype, pd.CategoricalDtype):
+        return tickers.astype("category")
+    categories = tickers.cat.categories
+    if categories.is_monotonic_increasing:
+        return tickers
+    return tickers.cat.reorder_categories(categories.sort_values())
+
+# Share counts: always whole numbers, usually stored as int64/float64 by the
+# exporters. Prices stay float64 since entry/exit prices and P&L are reported.
+_VOLUME_COLUMNS = ("volume", "bu", "sd", "fb", "fs", "fn")
+_INT32 = np.iinfo(np.int32)
+
+def downcast_volumes(df: pd.DataFrame) -> pd.DataFrame:
+    """Store whole-number volume columns as int32 when every value fits."""
+    for col in _VOLUME_COLUMNS:
+        if col not in df.columns:
+            continue
+        values = df[col].to_numpy()
+        if values.dtype.kind not in "iuf" or values.dtype == np.int32 or values.size == 0:
+            continue
+        if values.dtype.kind == "f" and not np.array_equal(values, np.trunc(values)):
+            continue  # NaNs or fractional lots
+        if values.min() < _INT32.min or values.max() > _INT32.max:
+            continue
+        df[col] = values.astype(np.int32)
+    return df
+
+def _dictionary_columns(schema: pa.Schema) -> list[str]:
+    # A few hundred distinct tickers repeat across millions of rows: decoding
+    # them as a dictionary yields a Categorical straight from Arrow instead of
+    # materialising one Python string per row and hashing it again afterwards.
+    if "ticker" in schema.names and pa.types.is_string(schema.field("ticker").type):
+        return ["ticker"]
+    return []
+
+def _to_pandas(table: pa.Table) -> pd.DataFrame:
+    # One block per column and Arrow buffers released as they are converted, so
+    # peak memory stays near one copy of the data instead of two.
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+def _filter_ts(value, tz: str | None) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    if tz and ts.tzinfo is None:
+        return ts.tz_localize(tz)
+    if not tz and ts.tzinfo is not None:
+        return ts.tz_localize(None)
+    return ts
+
+def read_parquet_window(
+    path: str | Path,
+    columns: Iterable[str] | None = None,
+    since=None,
+    before=None,
+) -> pd.DataFrame:
+    """Read only the needed columns and, for timestamp ``time`` columns, rows in [since, before).
+
+    The projection is applied only when the file has a ``time`` column (index-based
+    files are read whole), and the time bounds are pushed into the parquet scan so
+    row groups outside the window are never decompressed.
+    """
+    schema = pq.read_schema(path)
+    selected = _project(schema, columns)
+    filters = []
+    if "time" in schema.names and pa.types.is_timestamp(schema.field("time").type):
+        tz = schema.field("time").type.tz
+        if since is not None:
+            filters.append(("time", ">=", _filter_ts(since, tz)))
+        if before is not None:
+            filters.append(("time", "<", _filter_ts(before, tz)))
+    table = pq.read_table(
+        path,
+        columns=selected,
+        filters=filters or None,
+        memory_map=True,
+        use_threads=True,
+        use_pandas_metadata=True,
+        read_dictionary=_dictionary_columns(schema),
+    )
+    return _to_pandas(table)
+
+def latest_parquet_time(path: str | Path) -> pd.Timestamp | None:
+    """Largest ``time`` value taken from the row-group footer statistics.
+
+    No column data is decoded. Returns None when the file has no timestamp
+    ``time`` column or any non-empty row group lacks min/max statistics, so the
+    caller can fall back to reading the column.
+    """
+    pf = pq.ParquetFile(path, memory_map=True)
+    schema = pf.schema_arrow
+    if "time" not in schema.names or not pa.types.is_timestamp(schema.field("time").type):
+        return None
+    tz = schema.field("time").type.tz
+    idx = pf.metadata.schema.names.index("time")
+    latest = None
+    for i in range(pf.metadata.num_row_groups):
+        rg = pf.metadata.row_group(i)
+        if rg.num_rows == 0:
+            continue
+        stats = rg.column(idx).statistics
+        if stats is None or not stats.has_min_max:
+            if stats is not None and stats.null_count == rg.num_rows:
+                continue  # all-NaT row group
+            return None
+        value = stats.max
+        if not isinstance(value, (dt.datetime, pd.Timestamp)):
+            return None
+        ts = pd.Timestamp(value)
+        ts = ts.tz_convert(tz) if ts.tzinfo is not None and tz else ts
+        latest = ts if latest is None or ts > latest else latest
+    return latest
+
+def _source_stamp(p: Path) -> bytes:
+    st = p.stat()
+    return f"{st.st_mtime_ns}:{st.st_size}".encode()
+
+def _columns_tag(columns: list[str] | None) -> bytes:
+    return b"*" if columns is None else ",".join(columns).encode()
+
+def _read_tail_cache(cache: Path, stamp: bytes, rows: int, columns: list[str] | None) -> pa.Table | None:
+    try:
+        table = ipc.open_file(pa.memory_map(str(cache))).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+    meta = table.schema.metadata or {}
+    if meta.get(_META_SOURCE) != stamp or int(meta.get(_META_ROWS, b"0")) < rows:
+        return None
+    if meta.get(_META_COLUMNS, b"*") != _columns_tag(columns):
+        return None
+    return table.slice(max(0, table.num_rows - rows))
+
+def _write_tail_cache(cache: Path, table: pa.Table, stamp: bytes, rows: int, columns: list[str] | None) -> None:
+    meta = dict(table.schema.metadata or {})
+    meta[_META_SOURCE] = stamp
+    meta[_META_ROWS] = str(rows).encode()
+    meta[_META_COLUMNS] = _columns_tag(columns)
+    table = table.replace_schema_metadata(meta)
+    tmp = cache.with_name(f"{cache.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with pa.OSFile(str(tmp), "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, cache)
+    except OSError as exc:
+        LOG.debug("Could not write tail cache %s: %s", cache, exc)
+        tmp.unlink(missing_ok=True)
+
+def _project(schema: pa.Schema, columns: Iterable[str] | None) -> list[str] | None:
+    # Index-based files (no ``time`` column) are read whole, as in read_parquet_window.
+    if columns is None or "time" not in schema.names:
+        return None
+    wanted = set(columns)
+    return [name for name in schema.names if name in wanted]
+
+def _read_tail(p: Path, rows: int, columns: Iterable[str] | None = None) -> pa.Table:
+    schema = pq.read_schema(p)
+    selected = _project(schema, columns)
+    cache = p.with_suffix(_TAIL_CACHE_SUFFIX)
+    stamp = _source_stamp(p)
+    cached = _read_tail_cache(cache, stamp, rows, selected)
+    if cached is not None:
+        return cached
+    # Only decode trailing row groups until enough rows are collected.
+    pf = pq.ParquetFile(p, memory_map=True, read_dictionary=_dictionary_columns(schema))
+    tables, count = [], 0
+    for i in reversed(range(pf.num_row_groups)):
+        tables.append(pf.read_row_group(i, columns=selected, use_pandas_metadata=True))
+        count += tables[-1].num_rows
+        if count >= rows:
+            break
+    if not tables:
+        empty = pf.schema_arrow.empty_table()
+        return empty if selected is None else empty.select(selected)
+    # Each row group carries its own ticker dictionary; the IPC file format
+    # needs a single one per column.
+    table = pa.concat_tables(tables[::-1]).unify_dictionaries()
+    table = table.slice(max(0, table.num_rows - rows))
+    _write_tail_cache(cache, table, stamp, rows, selected)
+    return table
+
+# In-process copy of the last load_recent_from_parquet() result per path,
+# keyed by the source stamp, so scheduler runs against an unchanged file skip
+# the read and the dtype normalisation entirely.
+_RECENT_CACHE: dict[str, tuple[bytes, int, tuple[str, ...] | None, pd.DataFrame]] = {}
+_RECENT_LOCK = threading.Lock()
+
+def load_recent_from_parquet(path: str, rows: int = 5000, columns: Iterable[str] | None = None) -> pd.DataFrame:
+    """Last ``rows`` rows of ``path``, reading only ``columns`` when given."""
     p = Path(path)
     if not p.exists():
         return pd.DataFrame()
-    df = pd.read_parquet(p)
-    if "time" in df.columns:
+    key = str(p)
+    stamp = _source_stamp(p)
+    cols = tuple(columns) if columns is not None else None
+    with _RECENT_LOCK:
+        hit = _RECENT_CACHE.get(key)
+    if hit is not None and hit[:3] == (stamp, rows, cols):
+        # Shallow copy: callers may add or replace columns without affecting the cache.
+        return hit[3].copy(deep=False)
+    df = _load_recent(p, rows, cols)
+    with _RECENT_LOCK:
+        _RECENT_CACHE[key] = (stamp, rows, cols, df)
+    return df.copy(deep=False)
+
+def _load_recent(p: Path, rows: int, columns: Iterable[str] | None) -> pd.DataFrame:
+    if rows > 0:
+        df = _to_pandas(_read_tail(p, rows, columns))
+    else:
+        df = read_parquet_window(p, columns)
+    if "time" in df.columns and not pd.api.types.is_datetime64_any_dtype(df["time"]):
         df["time"] = pd.to_datetime(df["time"])
-    return df.tail(rows)
+    if "ticker" in df.columns:
+        df["ticker"] = as_ticker_category(df["ticker"])
+    return downcast_volumes(df).tail(rows)
@@ -7,7 +7,10 @@ from typing import Optional
 import pandas as pd
 
 from src.fiin_alerts.config import DATA_PARQUET_PATH
+from src.fiin_alerts.data.parquet_adapter import as_ticker_category, downcast_volumes, read_parquet_window
 from src.fiin_alerts.signals.v12_strategy import (
+    INDICATOR_WARMUP_DAYS,
+    INPUT_COLUMNS,
     run_v12_backtest,
     trades_to_signal_frame,
 )
@@ -16,18 +19,27 @@ DEFAULT_START = "2025-07-01"
 DEFAULT_END = "2025-08-31"
 
 
-def _load_source_data(path: Path) -> pd.DataFrame:
+def _load_source_data(path: Path, start_date: str | None = None, end_date: str | None = None) -> pd.DataFrame:
     if not path.exists():
         raise FileNotFoundError(f"data file not found: {path}")
-    df = pd.read_parquet(path)
+    since = pd.Timestamp(start_date) - pd.Timedelta(days=INDICATOR_WARMUP_DAYS) if start_date else None
+    before = pd.Timestamp(end_date) + pd.Timedelta(days=1) if end_date else None
+    df = read_parquet_window(path, INPUT_COLUMNS, since=since, before=before)
     if "time" in df.columns:
-        df["time"] = pd.to_datetime(df["time"], errors="coerce")
+        if not pd.api.types.is_datetime64_any_dtype(df["time"]):
+            df["time"] = pd.to_datetime(df["time"], errors="coerce")
         df = df.dropna(subset=["time"])
+        if since is not None:
+            df = df[df["time"] >= since]
+        if before is not None:
+            df = df[df["time"] < before]
     elif isinstance(df.index, pd.DatetimeIndex):
         df = df.copy()
     else:
         raise ValueError("dataframe must include 'time' column or datetime index")
-    return df
+    if "ticker" in df.columns:
+        df["ticker"] = as_ticker_category(df["ticker"])
+    return downcast_volumes(df)
 
 
 def export_signals(
@@ -39,7 +51,7 @@ def export_signals(
     min_volume_ma20: int,
     max_candidates: int,
 ) -> pd.DataFrame:
-    data = _load_source_data(data_path)
+    data = _load_source_data(data_path, start_date, end_date)
     trades = run_v12_backtest(
         data,
         start_date,
@@ -2,7 +2,12 @@
 from __future__ import annotations
 
 import argparse
+import functools
+import json
 import logging
+import math
+import os
+import threading
 from datetime import datetime
 from typing import Iterable, List
 from zoneinfo import ZoneInfo
@@ -22,28 +27,50 @@ from src.fiin_alerts.config import (
     SUBJECT_PREFIX,
 )
 from src.fiin_alerts.data.fiinquant_adapter import fetch_intraday
-from src.fiin_alerts.data.parquet_adapter import load_recent_from_parquet
+from src.fiin_alerts.data.parquet_adapter import (
+    as_ticker_category,
+    downcast_volumes,
+    latest_parquet_time,
+    load_recent_from_parquet,
+    read_parquet_window,
+)
 from src.fiin_alerts.logging import setup
 from src.fiin_alerts.notify.composer import render_alert_email
 from src.fiin_alerts.notify.gmail_client import send_email
-from src.fiin_alerts.signals.v4_robust import AlertItem
-from src.fiin_alerts.signals.v12_strategy import run_v12_backtest
-from src.fiin_alerts.state.store import already_sent, mark_sent
+from src.fiin_alerts.signals.v4_robust import INPUT_COLUMNS as V4_INPUT_COLUMNS, AlertItem
+from src.fiin_alerts.signals.v12_strategy import INDICATOR_WARMUP_DAYS, INPUT_COLUMNS, run_v12_backtest
+from src.fiin_alerts.state.store import already_sent_many, mark_sent
 
 LOG = logging.getLogger(__name__)
 _FALLBACK_TICKERS = DEFAULT_TICKERS or ["HPG", "SSI", "VCB", "VNM"]
+_FALLBACK_UPPER = tuple(t.upper() for t in _FALLBACK_TICKERS)
+_TZ = ZoneInfo(TIMEZONE)
+
+# Parsed parquet windows reused across scheduler cycles while the file is
+# unchanged. Keyed by (path, columns, since); the value carries the file stamp
+# it was read at, so a rewrite of the parquet invalidates it.
+_PARQUET_CACHE: dict[tuple, tuple[tuple[int, int], pd.DataFrame]] = {}
+_PARQUET_CACHE_LOCK = threading.Lock()
 
 
 def _parse_tickers(raw: Iterable[str] | None) -> List[str]:
-    if not raw:
-        return [t.upper() for t in _FALLBACK_TICKERS]
-    parsed = [token.strip().upper() for token in raw if token and token.strip()]
-    return parsed or [t.upper() for t in _FALLBACK_TICKERS]
+    if raw:
+        parsed = [stripped.upper() for token in raw if token and (stripped := token.strip())]
+        if parsed:
+            return parsed
+    return list(_FALLBACK_UPPER)
+
+
+@functools.lru_cache(maxsize=32)
+def _split_csv(raw: str) -> tuple[str, ...]:
+    """Non-empty, stripped tokens of a comma separated CLI value."""
+    return tuple(stripped for token in raw.split(",") if (stripped := token.strip()))
 
 
-def _fetch_source_data(tickers: List[str]) -> pd.DataFrame:
-    df = pd.DataFrame()
-    if FQ_USERNAME and FQ_PASSWORD:
+def _fetch_source_data(tickers: List[str]) -> pd.DataFrame | None:
+    """Intraday bars from FiinQuant, else the parquet tail; None when neither has data."""
+    df = None
+    if tickers and FQ_USERNAME and FQ_PASSWORD:
         try:
             df = fetch_intraday(
                 FQ_USERNAME,
@@ -54,34 +81,69 @@ def _fetch_source_data(tickers: List[str]) -> pd.DataFrame:
             )
         except Exception as exc:  # pragma: no cover - defensive
             LOG.warning("FiinQuant fetch failed: %s", exc)
-            df = pd.DataFrame()
-    if df is None or df.empty:
-        fallback = pd.DataFrame()
-        if DATA_PARQUET_PATH:
-            try:
-                candidate = load_recent_from_parquet(DATA_PARQUET_PATH)
-            except FileNotFoundError:
-                LOG.info('Parquet fallback missing path=%s', DATA_PARQUET_PATH)
-                candidate = None
-            if isinstance(candidate, pd.DataFrame) and not candidate.empty:
-                fallback = candidate
-        df = fallback
-    return df if isinstance(df, pd.DataFrame) else pd.DataFrame()
-
-
-def _dedupe_alerts(alerts: List[AlertItem], mode: str) -> tuple[list[AlertItem], list[str]]:
+    if isinstance(df, pd.DataFrame) and not df.empty:
+        return df
+    if DATA_PARQUET_PATH:
+        try:
+            candidate = load_recent_from_parquet(DATA_PARQUET_PATH, columns=V4_INPUT_COLUMNS)
+        except FileNotFoundError:
+            LOG.info('Parquet fallback missing path=%s', DATA_PARQUET_PATH)
+            candidate = None
+        if isinstance(candidate, pd.DataFrame) and not candidate.empty:
+            return candidate
+    return None
+
+
+def _clean_addresses(raw: Iterable[str]) -> list[str]:
+    return [addr.strip() for addr in raw if addr and addr.strip()]
+
+
+def _alert_recipients(alerts: List[AlertItem], recipients: Iterable[str] | None) -> tuple[list[list[str]], list[str]]:
+    """Each alert's recipient list, plus the run's default list.
+
+    An explicit ``recipients`` override (--to) wins over per-alert ``to``;
+    otherwise an alert's own addresses are used, falling back to ALERT_TO.
+    """
+    override = _clean_addresses(recipients or [])
+    default_to = override or _clean_addresses(ALERT_TO)
+    if override:
+        return [default_to] * len(alerts), default_to
+    return [_clean_addresses(alert.to) or default_to for alert in alerts], default_to
+
+
+def _dedupe_alerts(
+    alerts: List[AlertItem],
+    mode: str,
+    tos: List[list[str]],
+    default_to: list[str],
+) -> tuple[list[AlertItem], list[str], list[list[str]]]:
+    # Date and fallback slot are per-run constants; only ticker/event/when vary.
+    today = datetime.now(_TZ).date().isoformat()
+    fallback_when = mode or "now"
+    # Alerts bound for anything but the default recipients also key on their
+    # set, so the same alert for two recipient sets counts as two deliveries;
+    # keys for the default recipients keep their original form.
+    default_set = frozenset(default_to)
+    candidates = [
+        f"{today}:{alert.ticker}:{alert.event_type}:{alert.when or fallback_when}"
+        + ("" if frozenset(to) == default_set else f":{','.join(sorted(set(to)))}")
+        for alert, to in zip(alerts, tos)
+    ]
+    # Keys seen earlier in this batch are skipped like already-sent ones, so a
+    # repeated alert is neither looked up twice nor e-mailed twice.
+    seen = already_sent_many(candidates)
     deduped: list[AlertItem] = []
     keys: list[str] = []
-    today = datetime.now(ZoneInfo(TIMEZONE)).date().isoformat()
-    for alert in alerts:
-        slot = (alert.when or mode or "now")
-        key = f"{today}:{alert.ticker}:{alert.event_type}:{slot}"
-        if already_sent(key):
+    deduped_tos: list[list[str]] = []
+    for alert, key, to in zip(alerts, candidates, tos):
+        if key in seen:
             LOG.debug("Skip duplicate alert key=%s", key)
             continue
+        seen.add(key)
         deduped.append(alert)
         keys.append(key)
-    return deduped, keys
+        deduped_tos.append(to)
+    return deduped, keys, deduped_tos
 
 
 def _build_subject(mode: str, count: int) -> str:
@@ -92,31 +154,63 @@ def _build_subject(mode: str, count: int) -> str:
         return f"{SUBJECT_PREFIX}{mode_tag}{count} alerts"
 
 
-def _log_summary(alerts: list[AlertItem]) -> None:
-    lines = []
-    for alert in alerts[:10]:
-        price_display = f"{alert.price:.2f}" if alert.price is not None else "-"
-        lines.append(
-            f"{alert.ticker} {alert.event_type} price={price_display} when={alert.when}"
-        )
-    extra = max(len(alerts) - len(lines), 0)
-    if extra:
-        lines.append(f"(+{extra} more)")
-    LOG.info("Summary: %s", " | ".join(lines))
+def _price_field(price: float | None) -> float | None:
+    # NaN/inf are not valid JSON; keep the two decimals the summary always showed.
+    if price is None or not math.isfinite(price):
+        return None
+    return round(float(price), 2)
 
 
-def _load_full_parquet(path: str) -> pd.DataFrame:
+def _log_summary(alerts: list[AlertItem]) -> None:
+    # One JSON document on one line, so log shippers can index the fields
+    # without parsing free text.
+    items = [
+        {"ticker": alert.ticker, "event": alert.event_type, "price": _price_field(alert.price), "when": alert.when}
+        for alert in alerts[:10]
+    ]
+    extra = max(len(alerts) - len(items), 0)
+    LOG.info("Summary: %s", json.dumps({"alerts": items, "more": extra}, ensure_ascii=False, separators=(",", ":")))
+
+
+def _load_full_parquet(path: str, columns: Iterable[str] | None = None, since: pd.Timestamp | None = None) -> pd.DataFrame:
+    """Read (or reuse) a parquet window; callers must not modify the result in place."""
     if not path:
         return pd.DataFrame()
     try:
-        df = pd.read_parquet(path)
+        st = os.stat(path)
+    except OSError:
+        return _read_full_parquet(path, columns, since)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cols = tuple(columns) if columns is not None else None
+    key = (path, cols, since)
+    with _PARQUET_CACHE_LOCK:
+        hit = _PARQUET_CACHE.get(key)
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
+    df = _read_full_parquet(path, columns, since)
+    with _PARQUET_CACHE_LOCK:
+        # Keep one window per (path, columns): drop stale stamps and older `since` values.
+        for k in [k for k, (s, _) in _PARQUET_CACHE.items() if k[0] == path and (s != stamp or k[1] == cols)]:
+            del _PARQUET_CACHE[k]
+        _PARQUET_CACHE[key] = (stamp, df)
+    return df
+
+
+def _read_full_parquet(path: str, columns: Iterable[str] | None, since: pd.Timestamp | None) -> pd.DataFrame:
+    try:
+        df = read_parquet_window(path, columns, since=since)
     except Exception as exc:
         LOG.warning("Failed to read parquet path=%s error=%s", path, exc)
         return pd.DataFrame()
+    if "ticker" in df.columns:
+        df["ticker"] = as_ticker_category(df["ticker"])
     if "time" in df.columns:
-        df["time"] = pd.to_datetime(df["time"], errors="coerce")
+        if not pd.api.types.is_datetime64_any_dtype(df["time"]):
+            df["time"] = pd.to_datetime(df["time"], errors="coerce")
+        if since is not None:
+            df = df[df["time"] >= since]
         df = df.dropna(subset=["time"]).sort_values(["time", "ticker"]) if "ticker" in df.columns else df
-    return df
+    return downcast_volumes(df)
 
 
 def _generate_v12_alerts_from_parquet() -> list[AlertItem]:
@@ -124,15 +218,32 @@ def _generate_v12_alerts_from_parquet() -> list[AlertItem]:
     if not DATA_PARQUET_PATH:
         LOG.info("DATA_PARQUET_PATH is not configured; cannot run V12 pipeline")
         return []
-    data = _load_full_parquet(DATA_PARQUET_PATH)
-    if data.empty or "time" not in data.columns:
-        return []
-    # Determine the latest business date available
-    last_date = pd.to_datetime(data["time"]).dt.normalize().max()
-    if pd.isna(last_date):
+    # Determine the latest business date from the footer statistics, falling
+    # back to the time column alone when the file carries none.
+    try:
+        last_time = latest_parquet_time(DATA_PARQUET_PATH)
+    except Exception as exc:
+        LOG.debug("No parquet footer statistics path=%s error=%s", DATA_PARQUET_PATH, exc)
+        last_time = None
+    if last_time is None:
+        times = _load_full_parquet(DATA_PARQUET_PATH, columns=["time"])
+        if times.empty or "time" not in times.columns:
+            return []
+        # _load_full_parquet already returns datetime64; normalizing the max is one scalar op
+        last_time = times["time"].max()
+    if pd.isna(last_time):
         return []
+    last_date = last_time.normalize()
     # Provide sufficient lookback for indicators and entries
-    start_date = (last_date - pd.Timedelta(days=60)).date().isoformat()
+    start_ts = last_date - pd.Timedelta(days=60)
+    data = _load_full_parquet(
+        DATA_PARQUET_PATH,
+        columns=INPUT_COLUMNS,
+        since=start_ts - pd.Timedelta(days=INDICATOR_WARMUP_DAYS),
+    )
+    if data.empty:
+        return []
+    start_date = start_ts.date().isoformat()
     end_date = last_date.date().isoformat()
     trades = run_v12_backtest(
         data,
@@ -144,33 +255,40 @@ def _generate_v12_alerts_from_parquet() -> list[AlertItem]:
     alerts: list[AlertItem] = []
     if not trades:
         return alerts
-    for tr in trades:
-        entry_date = pd.to_datetime(tr.get("entry_date")).normalize()
-        exit_date = pd.to_datetime(tr.get("exit_date")).normalize()
-        ticker = str(tr.get("ticker", ""))
+    # Normalise dates and compute returns once per column, then walk the rows
+    # in trade order so BUY/SELL alerts keep their original interleaving.
+    td = pd.DataFrame(trades)
+    for col in ("ticker", "entry_date", "exit_date", "entry_price", "exit_price", "profit"):
+        if col not in td.columns:
+            td[col] = None
+    td["entry_date"] = pd.to_datetime(td["entry_date"], errors="coerce").dt.normalize()
+    td["exit_date"] = pd.to_datetime(td["exit_date"], errors="coerce").dt.normalize()
+    entry_price = pd.to_numeric(td["entry_price"], errors="coerce")
+    exit_price = pd.to_numeric(td["exit_price"], errors="coerce")
+    td["profit_pct"] = exit_price.fillna(0.0) / entry_price.where(entry_price != 0) - 1
+    td["entry_price"] = entry_price
+    td["exit_price"] = exit_price
+    td["profit"] = pd.to_numeric(td["profit"], errors="coerce")
+    td["is_buy"] = td["entry_date"] == last_date
+    td["is_sell"] = td["exit_date"] == last_date
+    td = td[td["is_buy"] | td["is_sell"]]
+    when = last_date.date().isoformat()
+    for tr in td.itertuples(index=False, name="T"):
+        ticker = "" if pd.isna(tr.ticker) else str(tr.ticker)
         # BUY on latest day
-        if pd.notna(entry_date) and entry_date == last_date:
-            price = float(tr.get("entry_price", float("nan"))) if tr.get("entry_price") is not None else None
-            explain = "Action=buy"
-            alerts.append(AlertItem(ticker=ticker, event_type="BUY_NEW", price=price, when=entry_date.date().isoformat(), explain=explain))
+        if tr.is_buy:
+            price = None if pd.isna(tr.entry_price) else float(tr.entry_price)
+            alerts.append(AlertItem(ticker=ticker, event_type="BUY_NEW", price=price, when=when, explain="Action=buy"))
         # SELL on latest day
-        if pd.notna(exit_date) and exit_date == last_date:
-            price = float(tr.get("exit_price", float("nan"))) if tr.get("exit_price") is not None else None
-            profit = tr.get("profit")
-            profit_pct = None
-            try:
-                ep = float(tr.get("entry_price", 0) or 0)
-                xp = float(tr.get("exit_price", 0) or 0)
-                profit_pct = (xp / ep - 1) if ep else None
-            except Exception:
-                profit_pct = None
+        if tr.is_sell:
+            price = None if pd.isna(tr.exit_price) else float(tr.exit_price)
             parts = ["Action=sell"]
-            if profit is not None:
-                parts.append(f"profit={float(profit):.0f}")
-            if profit_pct is not None:
-                parts.append(f"profit_pct={profit_pct*100:.2f}%")
+            if not pd.isna(tr.profit):
+                parts.append(f"profit={tr.profit:.0f}")
+            if not pd.isna(tr.profit_pct):
+                parts.append(f"profit_pct={tr.profit_pct*100:.2f}%")
             explain = "; ".join(parts)
-            alerts.append(AlertItem(ticker=ticker, event_type="SELL", price=price, when=exit_date.date().isoformat(), explain=explain))
+            alerts.append(AlertItem(ticker=ticker, event_type="SELL", price=price, when=when, explain=explain))
     return alerts
 
 def run_once(
@@ -187,11 +305,12 @@ def run_once(
     if not alerts:
         LOG.info("No V12 alerts for latest date; fallback to intraday screener")
         frame = _fetch_source_data(resolved_tickers)
-        if frame.empty:
+        if frame is None or frame.empty:
             LOG.info("No market data available for tickers=%s", resolved_tickers)
-        # Keep legacy generate_alerts for fallback
-        from src.fiin_alerts.signals.v4_robust import generate_alerts as _gen_v4
-        alerts = _gen_v4(frame)
+        else:
+            # Keep legacy generate_alerts for fallback
+            from src.fiin_alerts.signals.v4_robust import generate_alerts as _gen_v4
+            alerts = _gen_v4(frame)
 
     if force_test:
         alerts = [AlertItem("TEST", "INFO", 1234.0, "now", "force-test alert")]
@@ -200,33 +319,47 @@ def run_once(
         LOG.info("No alerts generated for mode=%s", effective_mode)
         return 0
 
-    deduped, keys = _dedupe_alerts(alerts, effective_mode)
+    tos, default_to = _alert_recipients(alerts, recipients)
+    if not any(tos):
+        LOG.error("No recipients configured. Set ALERT_TO in .env or pass --to")
+        return 0
+    if not all(tos):
+        LOG.error("No recipients for %d alert(s); set ALERT_TO in .env or pass --to", tos.count([]))
+        alerts = [alert for alert, to in zip(alerts, tos) if to]
+        tos = [to for to in tos if to]
+
+    deduped, keys, deduped_tos = _dedupe_alerts(alerts, effective_mode, tos, default_to)
     if not deduped:
         LOG.info("All alerts already delivered for mode=%s", effective_mode)
         return 0
 
-    target_raw = list(recipients) if recipients else ALERT_TO
-    target = [addr.strip() for addr in target_raw if addr and addr.strip()]
-    if not target:
-        LOG.error("No recipients configured. Set ALERT_TO in .env or pass --to")
-        return 0
+    # One message per distinct recipient set, however many alerts share it;
+    # each bucket keeps the address order it was first seen with.
+    buckets: dict[frozenset[str], tuple[list[str], list[AlertItem], list[str]]] = {}
+    for alert, key, to in zip(deduped, keys, deduped_tos):
+        bucket = buckets.setdefault(frozenset(to), (to, [], []))
+        bucket[1].append(alert)
+        bucket[2].append(key)
 
-    html, text = render_alert_email(deduped)
-    subject = _build_subject(effective_mode, len(deduped))
-    _log_summary(deduped)
-
-    if dry_run:
-        LOG.info("Dry-run: would send to=%s subject=%s", target, subject)
-        return len(deduped)
-
-    message_id = send_email(ALERT_FROM, target, subject, html, text)
-    mark_sent(keys)
-    LOG.info(
-        "Email sent via Gmail API msg_id=%s count=%s recipients=%s",
-        message_id,
-        len(deduped),
-        len(target),
-    )
+    if LOG.isEnabledFor(logging.INFO):
+        _log_summary(deduped)
+
+    for bucket_to, bucket_alerts, bucket_keys in buckets.values():
+        html, text = render_alert_email(bucket_alerts)
+        subject = _build_subject(effective_mode, len(bucket_alerts))
+
+        if dry_run:
+            LOG.info("Dry-run: would send to=%s subject=%s", bucket_to, subject)
+            continue
+
+        message_id = send_email(ALERT_FROM, bucket_to, subject, html, text)
+        mark_sent(bucket_keys)
+        LOG.info(
+            "Email sent via Gmail API msg_id=%s count=%s recipients=%s",
+            message_id,
+            len(bucket_alerts),
+            len(bucket_to),
+        )
     return len(deduped)
 
 
@@ -240,16 +373,8 @@ def main() -> None:
     parser.add_argument("--force-test", action="store_true")
     args = parser.parse_args()
 
-    tickers = (
-        [token.strip() for token in args.tickers.split(",") if token.strip()]
-        if args.tickers
-        else None
-    )
-    override_recipients = (
-        [token.strip() for token in args.to.split(",") if token.strip()]
-        if args.to
-        else None
-    )
+    tickers = list(_split_csv(args.tickers)) if args.tickers else None
+    override_recipients = list(_split_csv(args.to)) if args.to else None
 
     run_once(
         mode=args.mode,
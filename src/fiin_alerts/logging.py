@@ -1,11 +1,33 @@
 from __future__ import annotations
-import logging, sys
+import logging, sys, time
+
+# Handler installed by setup(); later calls (every scheduler tick, CLI entry
+# points) only adjust the level instead of rebuilding the handler chain.
+_HANDLER: logging.Handler | None = None
+
+class _Formatter(logging.Formatter):
+    """Default asctime layout, with the strftime part reused within each second."""
+
+    _last: tuple[int, str] = (-1, "")
+
+    def formatTime(self, record, datefmt=None):
+        if datefmt:
+            return super().formatTime(record, datefmt)
+        sec = int(record.created)
+        last = self._last
+        if last[0] != sec:
+            last = (sec, time.strftime(self.default_time_format, self.converter(sec)))
+            self._last = last
+        return self.default_msec_format % (last[1], record.msecs)
 
 def setup(level=logging.INFO):
-    h = logging.StreamHandler(sys.stdout)
-    fmt = logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+    global _HANDLER
     root = logging.getLogger()
-    root.handlers.clear()
-    root.addHandler(h)
+    if _HANDLER is None or _HANDLER not in root.handlers:
+        h = logging.StreamHandler(sys.stdout)
+        fmt = _Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+        root.handlers.clear()
+        root.addHandler(h)
+        h.setFormatter(fmt)
+        _HANDLER = h
     root.setLevel(level)
-    h.setFormatter(fmt)
@@ -7,13 +7,37 @@ from src.fiin_alerts.signals.v4_robust import AlertItem
 
 TEMPLATES_DIR = Path(__file__).parent / "templates"
 
+# Template names end in ".j2", so list the compound extension explicitly;
+# otherwise ticker/explain values land in the HTML body unescaped.
+# Templates ship with the package and never change while a job runs, so they
+# are compiled once here instead of being re-checked on disk per render.
 env = Environment(
     loader=FileSystemLoader(str(TEMPLATES_DIR)),
-    autoescape=select_autoescape(["html", "xml"])
+    autoescape=select_autoescape(["html", "xml", "html.j2"]),
+    auto_reload=False,
+    cache_size=-1,
 )
+_HTML_TEMPLATE = env.get_template("alert_email.html.j2")
+_TEXT_TEMPLATE = env.get_template("alert_email.txt.j2")
+
+def _summarize(alerts: Sequence[AlertItem]) -> tuple[str, list[tuple[str, int]]]:
+    """Ticker list and per-event counts shared by both bodies, in one pass.
+
+    Matches Jinja's case-insensitive ``unique``/``groupby`` filters: the first
+    spelling wins and groups are sorted by their lower-cased key.
+    """
+    tickers: dict[str, str] = {}
+    events: dict[str, list] = {}
+    for a in alerts:
+        tickers.setdefault(a.ticker.lower(), a.ticker)
+        events.setdefault(a.event_type.lower(), [a.event_type, 0])[1] += 1
+    event_counts = [(events[k][0], events[k][1]) for k in sorted(events)]
+    return ", ".join(tickers.values()), event_counts
 
 def render_alert_email(alerts: Sequence[AlertItem]) -> tuple[str, str]:
     """Return (html, text) email bodies."""
-    html = env.get_template("alert_email.html.j2").render(alerts=alerts)
-    text = env.get_template("alert_email.txt.j2").render(alerts=alerts)
+    tickers, event_counts = _summarize(alerts)
+    context = {"alerts": alerts, "tickers": tickers, "event_counts": event_counts}
+    html = _HTML_TEMPLATE.render(context)
+    text = _TEXT_TEMPLATE.render(context)
     return html, text
@@ -1,7 +1,6 @@
 from __future__ import annotations
-import base64, pathlib, logging, time
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import base64, datetime as dt, email.utils, functools, pathlib, logging, random, threading, time
+from email.header import Header
 
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
@@ -13,10 +12,73 @@ LOG = logging.getLogger(__name__)
 SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
 SECRETS_DIR = pathlib.Path("secrets")
 TOKEN = SECRETS_DIR / "token.json"
+_SEND_ATTEMPTS = 6
+_RETRY_BASE_SECONDS = 1.0
+_MAX_BACKOFF_SECONDS = 64.0
+_RNG = random.Random()  # private, urandom-seeded jitter source
+
+# Precompiled multipart/alternative layout. Both parts are base64 encoded and
+# "_" is outside the base64 alphabet, so a fixed "=_" boundary can never occur
+# inside a body.
+_BOUNDARY = "=_fiin_alerts_alternative"
+_MESSAGE_TEMPLATE = (
+    'Content-Type: multipart/alternative; boundary="' + _BOUNDARY + '"\n'
+    "MIME-Version: 1.0\n"
+    "From: {sender}\n"
+    "To: {to}\n"
+    "Subject: {subject}\n"
+    "\n"
+    "{parts}"
+    "--" + _BOUNDARY + "--\n"
+)
+_PART_TEMPLATE = (
+    "--" + _BOUNDARY + "\n"
+    'Content-Type: text/{subtype}; charset="utf-8"\n'
+    "MIME-Version: 1.0\n"
+    "Content-Transfer-Encoding: base64\n"
+    "\n"
+    "{body}"
+)
+
+# One authorized Gmail client per thread: building it parses the discovery
+# document and sets up a new HTTPS transport, so each scheduler worker reuses
+# its own across runs and only rebuilds when the credentials stop being valid.
+# The client's httplib2 transport is not thread-safe, so it is never shared.
+# Each thread's slot holds service, creds and token_mtime (the token.json mtime
+# the client was built from).
+_SERVICE = threading.local()
+# Serializes loading (and possibly refreshing + rewriting) token.json.
+_SERVICE_LOCK = threading.Lock()
 
 class NeedsReconsentError(RuntimeError):
     pass
 
+class _TokenBucket:
+    """Blocking token bucket shared by every sender thread in the process."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._last) * self._rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+# Pace sends well under Gmail's per-user send quota so overlapping scheduler
+# jobs are throttled here instead of by 429s and their backoff sleeps.
+_SEND_BUCKET = _TokenBucket(rate=2.0, capacity=5)
+
 def _load_creds() -> Credentials:
     if not TOKEN.exists():
         raise NeedsReconsentError("Missing secrets/token.json. Run: python scripts/init_oauth.py")
@@ -32,26 +94,106 @@ def _load_creds() -> Credentials:
             raise NeedsReconsentError("Invalid creds. Re-run OAuth init.")
     return creds
 
+def _header_value(value: str) -> str:
+    if value.isascii():
+        return value
+    return Header(value, "utf-8").encode()
+
+def _part(subtype: str, body: str) -> str:
+    encoded = base64.encodebytes(body.encode("utf-8")).decode("ascii")
+    return _PART_TEMPLATE.format(subtype=subtype, body=encoded)
+
+@functools.lru_cache(maxsize=8)
+def _address_headers(sender: str, to: tuple[str, ...]) -> tuple[str, str]:
+    """Encoded From/To values; sender and recipients are fixed config per run."""
+    recipients = ", ".join(to)
+    if len(recipients) > 72:
+        recipients = ",\n ".join(to)  # fold long recipient lists
+    return _header_value(sender), _header_value(recipients)
+
 def _build_message(sender: str, to: list[str], subject: str, html: str, text: str | None = None) -> dict:
-    msg = MIMEMultipart("alternative")
-    msg["From"] = sender
-    msg["To"] = ", ".join(to)
-    msg["Subject"] = subject
-    if text:
-        msg.attach(MIMEText(text, "plain", "utf-8"))
-    msg.attach(MIMEText(html, "html", "utf-8"))
-    raw = base64.urlsafe_b64encode(msg.as_bytes()).decode("utf-8")  # base64url
-    return {"raw": raw}
+    return {"raw": _raw_message(sender, tuple(to), subject, html, text)}
+
+@functools.lru_cache(maxsize=64)
+def _raw_message(sender: str, to: tuple[str, ...], subject: str, html: str, text: str | None) -> str:
+    """base64url RFC 822 payload; identical alerts (test sends, repeats) reuse it."""
+    from_value, to_value = _address_headers(sender, to)
+    parts = (_part("plain", text) if text else "") + _part("html", html)
+    msg = _MESSAGE_TEMPLATE.format(
+        sender=from_value,
+        to=to_value,
+        subject=_header_value(subject),
+        parts=parts,
+    )
+    return base64.urlsafe_b64encode(msg.encode("ascii")).decode("ascii")  # base64url
+
+def _token_mtime() -> int | None:
+    try:
+        return TOKEN.stat().st_mtime_ns
+    except OSError:
+        return None
+
+def _get_service():
+    local = _SERVICE
+    service = getattr(local, "service", None)
+    creds = getattr(local, "creds", None)
+    # Credentials.valid already treats a token inside google-auth's refresh
+    # margin as expired. A rewritten token.json (renew_oauth.py re-consent)
+    # also forces a rebuild so the new grant is picked up without a restart.
+    if (
+        service is None
+        or creds is None
+        or not creds.valid
+        or _token_mtime() != getattr(local, "token_mtime", None)
+    ):
+        with _SERVICE_LOCK:
+            creds = _load_creds()
+            mtime = _token_mtime()  # after _load_creds may have rewritten it
+        service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+        local.service, local.creds, local.token_mtime = service, creds, mtime
+    return service
+
+def _reset_service() -> None:
+    """Drop the calling thread's client; other threads keep theirs."""
+    _SERVICE.service = None
+    _SERVICE.creds = None
+    _SERVICE.token_mtime = None
+
+def _retry_after(e: HttpError) -> float | None:
+    """Seconds asked for by a Retry-After header (delta or HTTP date), if any."""
+    resp = getattr(e, "resp", None)
+    value = resp.get("retry-after") if hasattr(resp, "get") else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=dt.timezone.utc)
+    return max(0.0, (when - dt.datetime.now(dt.timezone.utc)).total_seconds())
+
+def _retry_delay(e: HttpError, attempt: int) -> float:
+    # Wait as long as the server asks (capped so a scheduler thread is not
+    # parked for minutes); otherwise full jitter keeps concurrent senders from
+    # retrying in lockstep.
+    asked = _retry_after(e)
+    if asked is not None:
+        return min(asked, _MAX_BACKOFF_SECONDS)
+    return _RNG.uniform(0, min(_RETRY_BASE_SECONDS * 2 ** attempt, _MAX_BACKOFF_SECONDS))
 
 def send_email(sender: str, to: list[str], subject: str, html: str, text: str | None = None) -> str:
-    creds = _load_creds()
-    service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+    service = _get_service()
     body = _build_message(sender, to, subject, html, text)
     try:
-        backoff = 1.0
         last_error: HttpError | None = None
-        for attempt in range(6):
+        for attempt in range(_SEND_ATTEMPTS):
             try:
+                _SEND_BUCKET.acquire()
                 resp = service.users().messages().send(userId="me", body=body).execute()
                 msg_id = resp.get("id", "")
                 LOG.info("Email sent id=%s to=%s", msg_id, to)
@@ -61,15 +203,17 @@ def send_email(sender: str, to: list[str], subject: str, html: str, text: str |
                 if status is None:
                     resp_obj = getattr(e, "resp", None)
                     status = getattr(resp_obj, "status", None) if resp_obj is not None else None
-                if status in (403, 429, 500):
+                if status in (403, 429, 500) and attempt + 1 < _SEND_ATTEMPTS:
+                    backoff = _retry_delay(e, attempt)
                     LOG.warning("Gmail API throttled/err %s. Retry in %.1fs (attempt %d)", status, backoff, attempt + 1)
                     time.sleep(backoff)
-                    backoff = min(backoff * 2, 64)
                     last_error = e
                     continue
                 raise
         if last_error is not None:
             raise last_error
-    except HttpError:
+    except (HttpError, OSError):
+        # Drop the cached client so the next run starts from a fresh transport.
+        _reset_service()
         raise
-    
+
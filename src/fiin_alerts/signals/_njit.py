@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+# numba is listed in requirements.txt and is the path deployments run, but the
+# import stays optional: when it is missing, ``njit`` becomes a no-op decorator
+# and callers check HAVE_NUMBA to keep using their vectorised pandas path
+# instead of running the decorated loops in pure Python.
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:  # pragma: no cover - depends on the environment
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(fn):
+            return fn
+
+        return decorator
+
+    prange = range
+
+__all__ = ["HAVE_NUMBA", "njit", "prange"]
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import numpy as np
+
+from src.fiin_alerts.signals._njit import njit
+
+# The kernels below follow pandas' fixed-window rolling mean/var (Kahan-compensated
+# add/remove, constant-run detection), applied per contiguous ticker segment, so the
+# numba paths in v12_strategy and v4_robust reproduce the pandas values their
+# filters compare against. Each fills out[s:e] for one segment.
+@njit(cache=True)
+def _rolling_mean_segment(values: np.ndarray, s: int, e: int, window: int, min_periods: int, out: np.ndarray) -> None:
+    nobs = 0
+    neg_ct = 0
+    sum_x = 0.0
+    comp_add = 0.0
+    comp_remove = 0.0
+    same_run = 0
+    prev = values[s]
+    for i in range(s, e):
+        if i - window >= s:
+            val = values[i - window]
+            if not np.isnan(val):
+                nobs -= 1
+                y = -val - comp_remove
+                t = sum_x + y
+                comp_remove = t - sum_x - y
+                sum_x = t
+                if val < 0:
+                    neg_ct -= 1
+        val = values[i]
+        if not np.isnan(val):
+            nobs += 1
+            y = val - comp_add
+            t = sum_x + y
+            comp_add = t - sum_x - y
+            sum_x = t
+            if val < 0:
+                neg_ct += 1
+            if val == prev:
+                same_run += 1
+            else:
+                same_run = 1
+            prev = val
+        if nobs >= min_periods and nobs > 0:
+            result = sum_x / nobs
+            if same_run >= nobs:
+                result = prev
+            elif neg_ct == 0 and result < 0:
+                result = 0.0
+            elif neg_ct == nobs and result > 0:
+                result = 0.0
+            out[i] = result
+        else:
+            out[i] = np.nan
+
+
+@njit(cache=True)
+def _rolling_std_segment(values: np.ndarray, s: int, e: int, window: int, min_periods: int, out: np.ndarray) -> None:
+    """Sample (ddof=1) rolling standard deviation, Welford-style like pandas."""
+    nobs = 0
+    mean_x = 0.0
+    ssqdm_x = 0.0
+    comp_add = 0.0
+    comp_remove = 0.0
+    same_run = 0
+    prev = values[s]
+    for i in range(s, e):
+        if i - window >= s:
+            val = values[i - window]
+            if not np.isnan(val):
+                nobs -= 1
+                if nobs:
+                    prev_mean = mean_x - comp_remove
+                    y = val - comp_remove
+                    t = y - mean_x
+                    comp_remove = t + mean_x - y
+                    mean_x -= t / nobs
+                    ssqdm_x -= (val - prev_mean) * (val - mean_x)
+                else:
+                    mean_x = 0.0
+                    ssqdm_x = 0.0
+        val = values[i]
+        if not np.isnan(val):
+            if val == prev:
+                same_run += 1
+            else:
+                same_run = 1
+            prev = val
+            nobs += 1
+            prev_mean = mean_x - comp_add
+            y = val - comp_add
+            t = y - mean_x
+            comp_add = t + mean_x - y
+            mean_x += t / nobs
+            ssqdm_x += (val - prev_mean) * (val - mean_x)
+        if nobs >= max(min_periods, 1) and nobs > 1:
+            if same_run >= nobs:
+                out[i] = 0.0
+            else:
+                var = ssqdm_x / (nobs - 1)
+                out[i] = np.sqrt(var) if var > 0 else 0.0
+        else:
+            out[i] = np.nan
+
+
+@njit(cache=True)
+def _rolling_sum_segment(values: np.ndarray, s: int, e: int, window: int, min_periods: int, out: np.ndarray) -> None:
+    nobs = 0
+    sum_x = 0.0
+    comp_add = 0.0
+    comp_remove = 0.0
+    same_run = 0
+    prev = values[s]
+    for i in range(s, e):
+        if i - window >= s:
+            val = values[i - window]
+            if not np.isnan(val):
+                nobs -= 1
+                y = -val - comp_remove
+                t = sum_x + y
+                comp_remove = t - sum_x - y
+                sum_x = t
+        val = values[i]
+        if not np.isnan(val):
+            nobs += 1
+            y = val - comp_add
+            t = sum_x + y
+            comp_add = t - sum_x - y
+            sum_x = t
+            if val == prev:
+                same_run += 1
+            else:
+                same_run = 1
+            prev = val
+        if nobs >= min_periods and nobs > 0:
+            out[i] = prev * nobs if same_run >= nobs else sum_x
+        else:
+            out[i] = np.nan
@@ -1,11 +1,16 @@
 ﻿from __future__ import annotations
 
-from collections import deque
+import math
+from dataclasses import dataclass
 from typing import Dict, Iterable, List, Tuple
 
 import numpy as np
 import pandas as pd
 
+from src.fiin_alerts.data.parquet_adapter import as_ticker_category
+from src.fiin_alerts.signals._njit import HAVE_NUMBA, njit, prange
+from src.fiin_alerts.signals._rolling import _rolling_mean_segment, _rolling_std_segment, _rolling_sum_segment
+
 REQUIRED_COLUMNS = [
     "market_close",
     "market_MA50",
@@ -28,24 +33,235 @@ REQUIRED_COLUMNS = [
     "atr_14",
 ]
 
+# Every column the v12 pipeline reads when present (raw inputs plus indicators it
+# would otherwise compute), so loaders can project parquet reads down to these.
+INPUT_COLUMNS = list(dict.fromkeys([
+    "time",
+    "ticker",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "adj_factor",
+    "market_high",
+    "market_low",
+    "boll_upper",
+    "boll_lower",
+    "mfi_14",
+    "obv",
+    *REQUIRED_COLUMNS,
+]))
+
+# Calendar days of history to load ahead of a backtest window so the longest
+# lookbacks (200-session SMA, EWM-based MACD) warm up as they would on full history.
+INDICATOR_WARMUP_DAYS = 730
+
 
 def _ensure_time_index(data: pd.DataFrame) -> pd.DataFrame:
+    """Frame with a datetime ``time`` and a normalised ``date`` column, rows unordered.
+
+    The caller orders rows itself, so no sort happens here. The copy is
+    shallow: with copy-on-write, columns added later never reach ``data``.
+    """
     if "time" in data.columns:
-        clone = data.copy()
-        clone["time"] = pd.to_datetime(clone["time"], errors="coerce")
-        clone = clone.dropna(subset=["time"])
-        clone = clone.sort_values(["time", "ticker"])
+        clone = data.copy(deep=False)
+        if not pd.api.types.is_datetime64_any_dtype(clone["time"]):
+            clone["time"] = pd.to_datetime(clone["time"], errors="coerce")
+        if clone["time"].hasnans:
+            clone = clone.dropna(subset=["time"])
         clone["date"] = clone["time"].dt.normalize()
         return clone
     if isinstance(data.index, pd.DatetimeIndex):
-        clone = data.copy()
+        clone = data.copy(deep=False)
         clone["time"] = clone.index.to_series()
         clone["date"] = clone["time"].dt.normalize()
         return clone.reset_index(drop=True)
     raise ValueError("data must provide datetime index or 'time' column")
 
 
+def _is_ticker_time_sorted(working: pd.DataFrame) -> bool:
+    """True when rows already follow sort_values(["ticker", "time"]) order."""
+    codes = working["ticker"].cat.codes.to_numpy()
+    times = pd.DatetimeIndex(working["time"]).asi8
+    code_step = np.diff(codes)
+    return bool((code_step >= 0).all() and ((code_step > 0) | (np.diff(times) >= 0)).all())
+
+
+@njit(cache=True)
+def _rsi_segment(close: np.ndarray, s: int, e: int, window: int, scratch: np.ndarray, out: np.ndarray) -> None:
+    """Simple-average RSI; ``scratch`` is a (4, n) work buffer for gains, losses and their means."""
+    scratch[0, s] = 0.0
+    scratch[1, s] = 0.0
+    for i in range(s + 1, e):
+        d = close[i] - close[i - 1]
+        scratch[0, i] = d if d > 0 else 0.0
+        scratch[1, i] = -d if d < 0 else 0.0
+    _rolling_mean_segment(scratch[0], s, e, window, window, scratch[2])
+    _rolling_mean_segment(scratch[1], s, e, window, window, scratch[3])
+    for i in range(s, e):
+        avg_loss = scratch[3, i]
+        if avg_loss != 0.0:
+            out[i] = 100.0 - 100.0 / (1.0 + scratch[2, i] / avg_loss)
+        else:
+            out[i] = np.nan
+
+
+@njit(cache=True)
+def _rsi_kernel(close: np.ndarray, bounds: np.ndarray, window: int) -> np.ndarray:
+    n = close.shape[0]
+    out = np.empty(n)
+    scratch = np.empty((4, n))
+    for k in range(bounds.shape[0] - 1):
+        _rsi_segment(close, bounds[k], bounds[k + 1], window, scratch, out)
+    return out
+
+
+@njit(cache=True)
+def _ewm_segment(values: np.ndarray, s: int, e: int, alpha: float, out: np.ndarray) -> None:
+    """``ewm(alpha=alpha, adjust=False).mean()`` over one segment, as pandas computes it."""
+    old_wt_factor = 1.0 - alpha
+    weighted = values[s]
+    out[s] = weighted
+    old_wt = 1.0
+    for i in range(s + 1, e):
+        cur = values[i]
+        is_observation = not np.isnan(cur)
+        if not np.isnan(weighted):
+            # A gap keeps decaying the old weight until the next observation.
+            old_wt *= old_wt_factor
+            if is_observation:
+                if weighted != cur:
+                    weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+                old_wt = 1.0
+        elif is_observation:
+            weighted = cur
+        out[i] = weighted
+
+
+@njit(cache=True, parallel=True)
+def _macd_kernel(close: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    """Rows: MACD line, signal line, and the two EMAs used as scratch."""
+    n = close.shape[0]
+    out = np.empty((4, n))
+    for k in prange(bounds.shape[0] - 1):
+        s = bounds[k]
+        e = bounds[k + 1]
+        _ewm_segment(close, s, e, 2.0 / 13.0, out[2])
+        _ewm_segment(close, s, e, 2.0 / 27.0, out[3])
+        for i in range(s, e):
+            out[0, i] = out[2, i] - out[3, i]
+        _ewm_segment(out[0], s, e, 2.0 / 10.0, out[1])
+    return out
+
+
+@njit(cache=True)
+def _nanmax(a: float, b: float) -> float:
+    """np.fmax for scalars: NaN only when both sides are NaN."""
+    if np.isnan(a):
+        return b
+    if np.isnan(b):
+        return a
+    return a if a >= b else b
+
+
+@njit(cache=True, parallel=True)
+def _atr_mfi_kernel(
+    high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray, bounds: np.ndarray, window: int
+) -> np.ndarray:
+    """Rows: ATR, MFI; rows 2-4 hold true range and the signed money flows."""
+    n = close.shape[0]
+    out = np.empty((7, n))
+    for k in prange(bounds.shape[0] - 1):
+        s = bounds[k]
+        e = bounds[k + 1]
+        prev_close = np.nan
+        prev_typical = np.nan
+        for i in range(s, e):
+            h = high[i]
+            lo = low[i]
+            out[2, i] = _nanmax(_nanmax(h - lo, abs(h - prev_close)), abs(lo - prev_close))
+            typical = (h + lo + close[i]) / 3
+            flow = typical * volume[i]
+            delta = typical - prev_typical
+            out[3, i] = flow if delta > 0 else 0.0
+            # Negated like _compute_mfi's neg_flow, so the values match the original v12.
+            out[4, i] = -flow if delta < 0 else -0.0
+            prev_close = close[i]
+            prev_typical = typical
+        _rolling_mean_segment(out[2], s, e, window, window, out[0])
+        _rolling_sum_segment(out[3], s, e, window, window, out[5])
+        _rolling_sum_segment(out[4], s, e, window, window, out[6])
+        for i in range(s, e):
+            neg = out[6, i]
+            out[1, i] = 100.0 - 100.0 / (1.0 + out[5, i] / neg) if neg != 0.0 else np.nan
+    return out
+
+
+_FEATURE_ROWS = ("sma_5", "sma_50", "sma_200", "volume_ma20", "rsi_14", "boll_ma20", "boll_std20")
+_FEATURE_COLUMNS = {"sma_5", "sma_50", "sma_200", "volume_ma20", "rsi_14", "boll_width"}
+
+
+@njit(cache=True, parallel=True)
+def _ticker_features(close: np.ndarray, volume: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    """All per-ticker rolling features in one sweep; rows follow ``_FEATURE_ROWS``.
+
+    Each ticker segment is streamed while it is still cache-resident, and
+    segments are independent, so they run in parallel.
+    """
+    n = close.shape[0]
+    out = np.empty((7, n))
+    scratch = np.empty((4, n))
+    for k in prange(bounds.shape[0] - 1):
+        s = bounds[k]
+        e = bounds[k + 1]
+        _rolling_mean_segment(close, s, e, 5, 5, out[0])
+        _rolling_mean_segment(close, s, e, 50, 20, out[1])
+        _rolling_mean_segment(close, s, e, 200, 50, out[2])
+        _rolling_mean_segment(volume, s, e, 20, 20, out[3])
+        _rsi_segment(close, s, e, 14, scratch, out[4])
+        _rolling_mean_segment(close, s, e, 20, 20, out[5])
+        _rolling_std_segment(close, s, e, 20, 20, out[6])
+    return out
+
+
+def _group_rolling_mean(working: pd.DataFrame, column: str, window: int, min_periods: int) -> np.ndarray:
+    """Per-ticker rolling mean via groupby().rolling() rather than transform(lambda)."""
+    rolled = working.groupby("ticker", sort=False, observed=True)[column].rolling(window, min_periods=min_periods).mean()
+    # ``working`` is sorted by ticker, so groups come back in row order.
+    return rolled.to_numpy()
+
+
+def _group_rolling_std(working: pd.DataFrame, column: str, window: int, min_periods: int) -> np.ndarray:
+    rolled = working.groupby("ticker", sort=False, observed=True)[column].rolling(window, min_periods=min_periods).std()
+    return rolled.to_numpy()
+
+
+def _volume_spike(volume: np.ndarray, volume_ma20: np.ndarray) -> np.ndarray:
+    """volume / volume_ma20 capped at 10, NaN where the average is zero or missing.
+
+    Written into a single output buffer instead of the replace/divide/clip
+    chain of intermediate Series.
+    """
+    out = np.full(volume.shape[0], np.nan)
+    np.divide(volume, volume_ma20, out=out, where=volume_ma20 != 0.0)
+    np.minimum(out, 10.0, out=out)
+    return out
+
+
+def _segment_bounds(keys: pd.Series) -> np.ndarray:
+    """Start offsets of each run of equal keys, plus the total length."""
+    if isinstance(keys.dtype, pd.CategoricalDtype):
+        keys = pd.Series(keys.cat.codes.to_numpy())
+    starts = np.flatnonzero(keys.ne(keys.shift()).to_numpy())
+    return np.append(starts, len(keys)).astype(np.int64)
+
+
 def _compute_rsi(series: pd.Series, window: int = 14) -> pd.Series:
+    if HAVE_NUMBA:
+        bounds = np.array([0, len(series)], dtype=np.int64) if len(series) else np.zeros(1, dtype=np.int64)
+        values = _rsi_kernel(series.to_numpy(dtype=np.float64), bounds, window)
+        return pd.Series(values, index=series.index)
     delta = series.diff()
     gain = delta.where(delta > 0, 0.0)
     loss = -delta.where(delta < 0, 0.0)
@@ -63,12 +279,19 @@ def _compute_macd(series: pd.Series) -> Tuple[pd.Series, pd.Series]:
     return macd, signal
 
 
+def _true_range(high: pd.Series, low: pd.Series, close: pd.Series) -> pd.Series:
+    """max(high-low, |high-prev close|, |low-prev close|), skipping NaN terms.
+
+    np.fmax matches DataFrame.max(axis=1) without building a 3-column frame.
+    """
+    h = high.to_numpy(dtype=np.float64)
+    lo = low.to_numpy(dtype=np.float64)
+    prev_close = close.shift().to_numpy(dtype=np.float64)
+    return pd.Series(np.fmax(np.fmax(h - lo, np.abs(h - prev_close)), np.abs(lo - prev_close)), index=high.index)
+
+
 def _compute_atr(high: pd.Series, low: pd.Series, close: pd.Series, window: int = 14) -> pd.Series:
-    high_low = high - low
-    high_prev_close = (high - close.shift()).abs()
-    low_prev_close = (low - close.shift()).abs()
-    true_range = pd.concat([high_low, high_prev_close, low_prev_close], axis=1).max(axis=1)
-    return true_range.rolling(window, min_periods=window).mean()
+    return _true_range(high, low, close).rolling(window, min_periods=window).mean()
 
 
 def _compute_bollinger(series: pd.Series, window: int = 20, num_std: float = 2.0) -> Tuple[pd.Series, pd.Series, pd.Series]:
@@ -80,10 +303,28 @@ def _compute_bollinger(series: pd.Series, window: int = 20, num_std: float = 2.0
     return upper, lower, width
 
 
+def _obv_step(close: np.ndarray, volume: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Signed volume per row: volume * sign(close change), 0 at each segment start.
+
+    One subtract and sign over the flat arrays; NaN closes or volumes count as 0,
+    like the diff().fillna(0)/volume.fillna(0) chain.
+    """
+    step = np.zeros(close.shape[0])
+    np.subtract(close[1:], close[:-1], out=step[1:])
+    step[starts] = 0.0
+    np.sign(step, out=step)
+    step[np.isnan(step)] = 0.0
+    np.multiply(step, np.where(np.isnan(volume), 0.0, volume), out=step)
+    return step
+
+
 def _compute_obv(close: pd.Series, volume: pd.Series) -> pd.Series:
-    direction = np.sign(close.diff().fillna(0.0))
-    adjusted_volume = volume.fillna(0.0) * direction
-    return adjusted_volume.cumsum()
+    step = _obv_step(
+        close.to_numpy(dtype=np.float64),
+        volume.to_numpy(dtype=np.float64),
+        np.zeros(min(len(close), 1), dtype=np.int64),
+    )
+    return pd.Series(np.cumsum(step), index=close.index)
 
 
 def _compute_mfi(high: pd.Series, low: pd.Series, close: pd.Series, volume: pd.Series, window: int = 14) -> pd.Series:
@@ -97,89 +338,149 @@ def _compute_mfi(high: pd.Series, low: pd.Series, close: pd.Series, volume: pd.S
     flow_ratio = pos_roll / neg_roll.replace(0.0, np.nan)
     return 100 - (100 / (1 + flow_ratio))
 
+def _group_ewm(values: pd.Series, keys: pd.Series, span: int) -> np.ndarray:
+    """Per-ticker ``ewm(span, adjust=False).mean()``; rows must be sorted by ticker."""
+    return values.groupby(keys, sort=False, observed=True).ewm(span=span, adjust=False).mean().to_numpy()
+
+
+def _group_macd(working: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    if HAVE_NUMBA:
+        out = _macd_kernel(working["close"].to_numpy(dtype=np.float64), _segment_bounds(working["ticker"]))
+        return out[0], out[1]
+    keys = working["ticker"]
+    close = working["close"]
+    macd = _group_ewm(close, keys, 12) - _group_ewm(close, keys, 26)
+    signal = _group_ewm(pd.Series(macd, index=working.index), keys, 9)
+    return macd, signal
+
+
+def _group_rolling(values: np.ndarray, working: pd.DataFrame, window: int, how: str) -> np.ndarray:
+    series = pd.Series(values, index=working.index)
+    rolled = series.groupby(working["ticker"], sort=False, observed=True).rolling(window, min_periods=window)
+    return getattr(rolled, how)().to_numpy()
+
+
+def _group_atr(working: pd.DataFrame, window: int = 14) -> np.ndarray:
+    """Same as _compute_atr per ticker, with prev close shifted within each ticker."""
+    high = working["high"].to_numpy(dtype=np.float64)
+    low = working["low"].to_numpy(dtype=np.float64)
+    prev_close = working.groupby("ticker", sort=False, observed=True)["close"].shift().to_numpy(dtype=np.float64)
+    # fmax skips NaN like DataFrame.max(axis=1): only all-NaN rows stay NaN.
+    true_range = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+    return _group_rolling(true_range, working, window, "mean")
+
+
+def _group_mfi(working: pd.DataFrame, window: int = 14) -> np.ndarray:
+    typical = (working["high"] + working["low"] + working["close"]) / 3
+    money_flow = (typical * working["volume"]).to_numpy(dtype=np.float64)
+    delta = typical.groupby(working["ticker"], sort=False, observed=True).diff().to_numpy(dtype=np.float64)
+    pos_roll = _group_rolling(np.where(delta > 0, money_flow, 0.0), working, window, "sum")
+    # Negated like _compute_mfi's neg_flow, so the values match the original v12.
+    neg_roll = _group_rolling(-np.where(delta < 0, money_flow, 0.0), working, window, "sum")
+    flow_ratio = pos_roll / np.where(neg_roll == 0.0, np.nan, neg_roll)
+    return 100 - (100 / (1 + flow_ratio))
+
+
+def _group_obv(working: pd.DataFrame) -> np.ndarray:
+    # Rows are sorted by ticker, so each ticker is one contiguous segment.
+    step = _obv_step(
+        working["close"].to_numpy(dtype=np.float64),
+        working["volume"].to_numpy(dtype=np.float64),
+        _segment_bounds(working["ticker"])[:-1],
+    )
+    adjusted_volume = pd.Series(step, index=working.index)
+    return adjusted_volume.groupby(working["ticker"], sort=False, observed=True).cumsum().to_numpy()
+
+
 def ensure_technical_indicators(data: pd.DataFrame) -> pd.DataFrame:
     working = _ensure_time_index(data)
-    working["ticker"] = working["ticker"].astype(str)
-    working = working.sort_values(["ticker", "time"])
-    grouped = working.groupby("ticker", group_keys=False)
+    tickers = working["ticker"]
+    if not isinstance(tickers.dtype, pd.CategoricalDtype) or tickers.hasnans or not pd.api.types.is_string_dtype(tickers.cat.categories):
+        tickers = tickers.astype(str)
+    working["ticker"] = as_ticker_category(tickers)
+    # A stable sort, so rows sharing (ticker, time) keep their input order.
+    if not _is_ticker_time_sorted(working):
+        working = working.sort_values(["ticker", "time"])
+    grouped = working.groupby("ticker", group_keys=False, observed=True)
+
+    features: Dict[str, np.ndarray] = {}
+    if HAVE_NUMBA and _FEATURE_COLUMNS.difference(working.columns):
+        fused = _ticker_features(
+            working["close"].to_numpy(dtype=np.float64),
+            working["volume"].to_numpy(dtype=np.float64),
+            _segment_bounds(working["ticker"]),
+        )
+        features = dict(zip(_FEATURE_ROWS, fused))
 
     if "volume_ma20" not in working.columns:
-        working["volume_ma20"] = grouped["volume"].transform(lambda s: s.rolling(20, min_periods=20).mean())
+        working["volume_ma20"] = features["volume_ma20"] if features else _group_rolling_mean(working, "volume", 20, 20)
 
     if "sma_5" not in working.columns:
-        working["sma_5"] = grouped["close"].transform(lambda s: s.rolling(5, min_periods=5).mean())
+        working["sma_5"] = features["sma_5"] if features else _group_rolling_mean(working, "close", 5, 5)
 
     if "sma_50" not in working.columns:
-        working["sma_50"] = grouped["close"].transform(lambda s: s.rolling(50, min_periods=20).mean())
+        working["sma_50"] = features["sma_50"] if features else _group_rolling_mean(working, "close", 50, 20)
 
     if "sma_200" not in working.columns:
-        working["sma_200"] = grouped["close"].transform(lambda s: s.rolling(200, min_periods=50).mean())
+        working["sma_200"] = features["sma_200"] if features else _group_rolling_mean(working, "close", 200, 50)
 
     if "rsi_14" not in working.columns:
-        working["rsi_14"] = grouped["close"].transform(_compute_rsi)
+        if features:
+            working["rsi_14"] = features["rsi_14"]
+        else:
+            working["rsi_14"] = grouped["close"].transform(_compute_rsi)
 
     if "volume_spike" not in working.columns:
-        denom = working["volume_ma20"].replace(0.0, np.nan)
-        working["volume_spike"] = (working["volume"] / denom).clip(upper=10)
+        working["volume_spike"] = _volume_spike(
+            working["volume"].to_numpy(dtype=np.float64),
+            working["volume_ma20"].to_numpy(dtype=np.float64),
+        )
 
     needs_macd = {"macd", "macd_signal"}.difference(working.columns)
     if needs_macd:
-        macd_parts: List[pd.Series] = []
-        signal_parts: List[pd.Series] = []
-        for _, idx in grouped.groups.items():
-            close = working.loc[idx, "close"]
-            macd, signal = _compute_macd(close)
-            macd_parts.append(macd)
-            signal_parts.append(signal)
-        working["macd"] = pd.concat(macd_parts).sort_index()
-        working["macd_signal"] = pd.concat(signal_parts).sort_index()
+        working["macd"], working["macd_signal"] = _group_macd(working)
+
+    # ATR and MFI share one pass over high/low/close(/volume) per ticker.
+    atr_mfi = None
+    if (
+        HAVE_NUMBA
+        and {"atr_14", "mfi_14"}.difference(working.columns)
+        and {"high", "low", "close", "volume"}.issubset(working.columns)
+    ):
+        atr_mfi = _atr_mfi_kernel(
+            working["high"].to_numpy(dtype=np.float64),
+            working["low"].to_numpy(dtype=np.float64),
+            working["close"].to_numpy(dtype=np.float64),
+            working["volume"].to_numpy(dtype=np.float64),
+            _segment_bounds(working["ticker"]),
+            14,
+        )
 
     if "atr_14" not in working.columns and {"high", "low", "close"}.issubset(working.columns):
-        atr_parts: List[pd.Series] = []
-        for _, idx in grouped.groups.items():
-            atr_parts.append(_compute_atr(
-                working.loc[idx, "high"],
-                working.loc[idx, "low"],
-                working.loc[idx, "close"],
-            ))
-        working["atr_14"] = pd.concat(atr_parts).sort_index()
+        working["atr_14"] = atr_mfi[0] if atr_mfi is not None else _group_atr(working)
 
     if "boll_width" not in working.columns:
-        uppers: List[pd.Series] = []
-        lowers: List[pd.Series] = []
-        widths: List[pd.Series] = []
-        for _, idx in grouped.groups.items():
-            upper, lower, width = _compute_bollinger(working.loc[idx, "close"])
-            uppers.append(upper)
-            lowers.append(lower)
-            widths.append(width)
-        working["boll_upper"] = pd.concat(uppers).sort_index()
-        working["boll_lower"] = pd.concat(lowers).sort_index()
-        working["boll_width"] = pd.concat(widths).sort_index()
+        if features:
+            ma = features["boll_ma20"]
+            std = features["boll_std20"]
+        else:
+            ma = _group_rolling_mean(working, "close", 20, 20)
+            std = _group_rolling_std(working, "close", 20, 20)
+        upper = ma + 2.0 * std
+        lower = ma - 2.0 * std
+        working["boll_upper"] = upper
+        working["boll_lower"] = lower
+        working["boll_width"] = (upper - lower) / np.where(ma == 0.0, np.nan, ma)
 
     if "mfi_14" not in working.columns:
         if {"high", "low", "close", "volume"}.issubset(working.columns):
-            mfi_parts: List[pd.Series] = []
-            for _, idx in grouped.groups.items():
-                mfi_parts.append(_compute_mfi(
-                    working.loc[idx, "high"],
-                    working.loc[idx, "low"],
-                    working.loc[idx, "close"],
-                    working.loc[idx, "volume"],
-                ))
-            working["mfi_14"] = pd.concat(mfi_parts).sort_index()
+            working["mfi_14"] = atr_mfi[1] if atr_mfi is not None else _group_mfi(working)
         else:
             working["mfi_14"] = np.nan
 
     if "obv" not in working.columns:
         if {"close", "volume"}.issubset(working.columns):
-            obv_parts: List[pd.Series] = []
-            for _, idx in grouped.groups.items():
-                obv_parts.append(_compute_obv(
-                    working.loc[idx, "close"],
-                    working.loc[idx, "volume"],
-                ))
-            working["obv"] = pd.concat(obv_parts).sort_index()
+            working["obv"] = _group_obv(working)
         else:
             working["obv"] = np.nan
 
@@ -188,39 +489,37 @@ def ensure_technical_indicators(data: pd.DataFrame) -> pd.DataFrame:
         if "market_high" in working.columns and "market_low" in working.columns:
             market_cols.extend(["market_high", "market_low"])
         market_daily = working[["date", *market_cols]].drop_duplicates("date").set_index("date").sort_index()
+        # Every row's date is a market_daily key, so one positional lookup
+        # broadcasts each daily series back onto the rows with a take.
+        day_pos = market_daily.index.get_indexer(working["date"])
 
         if "market_MA50" not in working.columns:
             ma50 = market_daily["market_close"].rolling(50, min_periods=20).mean()
-            working["market_MA50"] = working["date"].map(ma50)
+            working["market_MA50"] = ma50.to_numpy()[day_pos]
 
         if "market_MA200" not in working.columns:
             ma200 = market_daily["market_close"].rolling(200, min_periods=50).mean()
-            working["market_MA200"] = working["date"].map(ma200)
+            working["market_MA200"] = ma200.to_numpy()[day_pos]
 
         if "market_rsi" not in working.columns:
             market_rsi = _compute_rsi(market_daily["market_close"]).ffill()
-            working["market_rsi"] = working["date"].map(market_rsi)
+            working["market_rsi"] = market_rsi.to_numpy()[day_pos]
 
         if "market_boll_width" not in working.columns:
             _, _, market_width = _compute_bollinger(market_daily["market_close"])
-            working["market_boll_width"] = working["date"].map(market_width)
+            working["market_boll_width"] = market_width.to_numpy()[day_pos]
             # Align with original v12.py behavior: provide a reasonable default
             working["market_boll_width"] = working["market_boll_width"].fillna(0.5)
 
         if "market_adx" not in working.columns and {"market_high", "market_low"}.issubset(working.columns):
             plus_dm = (market_daily["market_high"].diff().clip(lower=0)).fillna(0.0)
             minus_dm = (-market_daily["market_low"].diff().clip(upper=0)).fillna(0.0)
-            tr_components = pd.concat([
-                (market_daily["market_high"] - market_daily["market_low"]),
-                (market_daily["market_high"] - market_daily["market_close"].shift()).abs(),
-                (market_daily["market_low"] - market_daily["market_close"].shift()).abs(),
-            ], axis=1)
-            tr = tr_components.max(axis=1)
+            tr = _true_range(market_daily["market_high"], market_daily["market_low"], market_daily["market_close"])
             atr = tr.rolling(14, min_periods=14).mean()
             plus_di = 100 * (plus_dm.rolling(14, min_periods=14).sum() / atr.replace(0.0, np.nan))
             minus_di = 100 * (minus_dm.rolling(14, min_periods=14).sum() / atr.replace(0.0, np.nan))
             dx = (abs(plus_di - minus_di) / (plus_di + minus_di + 1e-9) * 100).rolling(14, min_periods=14).mean()
-            working["market_adx"] = working["date"].map(dx.ffill())
+            working["market_adx"] = dx.ffill().to_numpy()[day_pos]
 
         # Fallback: if we still don't have market_adx (e.g., parquet lacks market_high/market_low),
         # set a neutral baseline (25) to mirror v12.py defaulting behavior.
@@ -235,6 +534,60 @@ def ensure_technical_indicators(data: pd.DataFrame) -> pd.DataFrame:
 
     return working
 
+
+def warm_up_kernels() -> None:
+    """Compile the numba indicator kernels, or load them from numba's disk cache.
+
+    Runs ensure_technical_indicators on a tiny frame with the same column
+    dtypes as a real load, so long-running processes can pay the JIT cost at
+    start-up instead of on their first scheduled run. No-op without numba.
+    """
+    if not HAVE_NUMBA:
+        return
+    n = 30
+    close = np.linspace(10.0, 12.0, n)
+    sample = pd.DataFrame({
+        "ticker": as_ticker_category(pd.Series(["WARM"] * n)),
+        "time": pd.date_range("2020-01-01", periods=n, freq="D"),
+        "open": close,
+        "high": close + 0.1,
+        "low": close - 0.1,
+        "close": close,
+        "volume": np.arange(1, n + 1, dtype=np.int32),
+        "market_close": close,
+        "market_high": close + 0.1,
+        "market_low": close - 0.1,
+    })
+    ensure_technical_indicators(sample)
+
+_SCREEN_COLUMNS = (
+    "close", "volume", "volume_ma20", "sma_5", "sma_50", "sma_200",
+    "rsi_14", "volume_spike", "boll_width", "macd", "macd_signal", "atr_14",
+)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the ``k`` largest scores, like ``nlargest(k)`` (keep="first").
+
+    Ties keep row order and NaN scores only fill the tail, as in pandas, but
+    the selection is a linear-time partition rather than a full sort.
+    """
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    missing = np.isnan(scores)
+    valid = np.flatnonzero(~missing)
+    values = scores[valid]
+    if len(values) > k:
+        kth = np.partition(values, len(values) - k)[len(values) - k]
+        above = values > kth
+        ties = np.flatnonzero(values == kth)[: k - int(above.sum())]
+        above[ties] = True
+        valid = valid[above]
+        values = values[above]
+    ranked = valid[np.argsort(-values, kind="stable")]
+    return np.concatenate([ranked, np.flatnonzero(missing)])[:k]
+
+
 def screen_candidates_v12(
     df_day: pd.DataFrame,
     *,
@@ -259,74 +612,90 @@ def screen_candidates_v12(
     if not is_bull and not is_sideway:
         return pd.DataFrame(columns=df_day.columns)
 
-    scoped = df_day.copy()
-    scoped["close_adj"] = scoped["close"] * scoped.get("adj_factor", 1)
-    scoped = scoped[(scoped["volume_ma20"] > min_volume_ma20) & (scoped["volume"] > 300000)]
-    if scoped.empty:
-        return scoped
-
-    scoped["relative_strength"] = (
-        ((scoped["close_adj"] - scoped["sma_50"]) / scoped["sma_50"]) /
-        ((market_close - market_ma50) / market_ma50 + 1e-6)
-    )
-    scoped["short_momentum"] = (scoped["close_adj"] - scoped["sma_5"]) / scoped["sma_5"]
-    scoped["macd_histogram"] = scoped["macd"] - scoped["macd_signal"]
-
+    # Every filter below is fused into one boolean mask over plain arrays, so
+    # the day frame is sliced once instead of after each stage.
+    col = {name: df_day[name].to_numpy(dtype=np.float64) for name in _SCREEN_COLUMNS}
+    adj_factor = df_day["adj_factor"].to_numpy(dtype=np.float64) if "adj_factor" in df_day.columns else 1
+    close_adj = col["close"] * adj_factor
+    sma_5, sma_50, sma_200 = col["sma_5"], col["sma_50"], col["sma_200"]
+    rsi, volume_spike, boll_width = col["rsi_14"], col["volume_spike"], col["boll_width"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative_strength = (
+            ((close_adj - sma_50) / sma_50) /
+            ((market_close - market_ma50) / market_ma50 + 1e-6)
+        )
+        short_momentum = (close_adj - sma_5) / sma_5
+        macd_histogram = col["macd"] - col["macd_signal"]
+        mask = (col["volume_ma20"] > min_volume_ma20) & (col["volume"] > 300000)
+        if is_bull:
+            mask &= (
+                (close_adj > sma_200) &
+                (close_adj > sma_50) &
+                (sma_50 > sma_200) &
+                (rsi > 50) & (rsi < 80) &
+                (volume_spike > 0.3) &
+                (relative_strength > 1.05) &
+                (short_momentum > 0.01) &
+                (close_adj > sma_5)
+            )
+        else:
+            mask &= (
+                (rsi > 48) & (rsi < 55) &
+                (boll_width < 0.3) &
+                (macd_histogram > 0) &
+                (volume_spike >= 1.0) &
+                (short_momentum > 0.02) &
+                (col["atr_14"] / close_adj > 0.02) &
+                (close_adj > sma_50 * 0.95) &
+                (close_adj > sma_200 * 0.95) &
+                (close_adj > sma_50 + boll_width * sma_50 * 0.75)
+            )
+        rows = np.flatnonzero(mask)
+        if not is_bull:
+            boll_proximity = (close_adj[rows] - sma_50[rows]) / (sma_50[rows] * boll_width[rows])
+
+    scoped = df_day.iloc[rows].copy()
+    scoped["close_adj"] = close_adj[rows]
+    scoped["relative_strength"] = relative_strength[rows]
+    scoped["short_momentum"] = short_momentum[rows]
+    scoped["macd_histogram"] = macd_histogram[rows]
     if is_bull:
-        scoped = scoped[
-            (scoped["close_adj"] > scoped["sma_200"]) &
-            (scoped["close_adj"] > scoped["sma_50"]) &
-            (scoped["sma_50"] > scoped["sma_200"]) &
-            (scoped["rsi_14"] > 50) & (scoped["rsi_14"] < 80) &
-            (scoped["volume_spike"] > 0.3) &
-            (scoped["relative_strength"] > 1.05) &
-            (scoped["short_momentum"] > 0.01) &
-            (scoped["close_adj"] > scoped["sma_5"])
-        ]
-        if scoped.empty:
-            return scoped
         scoped["score"] = (
-            scoped["relative_strength"] * 0.35 +
-            scoped["short_momentum"] * 0.25 +
-            scoped["volume_spike"] * 0.25 +
-            scoped["macd_histogram"] * 0.15
+            relative_strength[rows] * 0.35 +
+            short_momentum[rows] * 0.25 +
+            volume_spike[rows] * 0.25 +
+            macd_histogram[rows] * 0.15
         )
     else:
-        scoped = scoped[
-            (scoped["rsi_14"] > 48) & (scoped["rsi_14"] < 55) &
-            (scoped["boll_width"] < 0.3) &
-            (scoped["macd_histogram"] > 0) &
-            (scoped["volume_spike"] >= 1.0) &
-            (scoped["short_momentum"] > 0.02) &
-            (scoped["atr_14"] / scoped["close_adj"] > 0.02) &
-            (scoped["close_adj"] > scoped["sma_50"] * 0.95) &
-            (scoped["close_adj"] > scoped["sma_200"] * 0.95) &
-            (scoped["close_adj"] > scoped["sma_50"] + scoped["boll_width"] * scoped["sma_50"] * 0.75)
-        ]
-        if scoped.empty:
-            return scoped
         max_candidates = max(5, int(max_candidates * 0.5))
-        scoped["boll_proximity"] = (
-            (scoped["close_adj"] - scoped["sma_50"]) /
-            (scoped["sma_50"] * scoped["boll_width"])
-        )
+        scoped["boll_proximity"] = boll_proximity
         scoped["score"] = (
-            scoped["volume_spike"] * 0.4 +
-            scoped["macd_histogram"] * 0.3 +
-            (55 - (scoped["rsi_14"] - 55).abs()) * 0.2 +
-            scoped["boll_proximity"] * 0.1
+            volume_spike[rows] * 0.4 +
+            macd_histogram[rows] * 0.3 +
+            (55 - np.abs(rsi[rows] - 55)) * 0.2 +
+            boll_proximity * 0.1
         )
 
-    return scoped.nlargest(max_candidates, "score")
+    return scoped.iloc[_top_k(scoped["score"].to_numpy(), max_candidates)]
 
 
-def _pivot_by_column(data: pd.DataFrame, column: str) -> pd.DataFrame | None:
-    if column not in data.columns:
-        return None
-    pivot = data.pivot_table(index="date", columns="ticker", values=column, aggfunc="last")
+def _pivot_by_column(last: pd.DataFrame, column: str) -> pd.DataFrame:
+    """One dates x tickers table from the per-(date, ticker) last values.
+
+    Drops all-NaN rows and columns, as pivot_table(dropna=True) did.
+    """
+    pivot = last[column].unstack("ticker").dropna(how="all").dropna(axis=1, how="all")
     return pivot.sort_index()
 
 
+def _as_grid(table: pd.DataFrame | None, dates: List[pd.Timestamp], tickers: pd.Index) -> np.ndarray | None:
+    if table is None:
+        return None
+    # DataFrame.to_numpy hands back the column-major block; the backtest reads
+    # one day (row) at a time, so lay each day's tickers out contiguously.
+    return np.ascontiguousarray(table.reindex(index=dates, columns=tickers).to_numpy(dtype=np.float64))
+
+
 def create_pivot_tables(data: pd.DataFrame) -> Dict[str, pd.DataFrame | None]:
     mapping = {
         "close": "pivoted_close",
@@ -346,11 +715,38 @@ def create_pivot_tables(data: pd.DataFrame) -> Dict[str, pd.DataFrame | None]:
         "sma_50": "pivoted_sma_50",
         "macd": "pivoted_macd",
     }
+    # Group (date, ticker) once for every column instead of a pivot_table per
+    # column; last() skips NaN just like aggfunc="last".
+    columns = [source for source in mapping if source in data.columns]
+    last = data.groupby(["date", "ticker"], observed=True)[columns].last() if columns else None
     tables: Dict[str, pd.DataFrame | None] = {}
     for source, target in mapping.items():
-        tables[target] = _pivot_by_column(data, source)
+        tables[target] = _pivot_by_column(last, source) if source in columns else None
     return tables
 
+@dataclass(slots=True)
+class _Position:
+    """One open backtest position; slots keep the per-day field reads cheap."""
+    shares: int
+    entry_price: float
+    avg_cost: float
+    tp: float
+    sl: float
+    trailing_sl: float
+    highest_price: float
+    entry_date: pd.Timestamp
+    pyramid_count: int = 0
+
+
+# Per-regime trading parameters, indexed by the day's phase code (bull, sideway, bear).
+_MARKET_PHASES = ("bull", "sideway", "bear")
+_PHASE_POSITION_MULTIPLIER = (1.2, 0.5, 0.0)
+_PHASE_MAX_HOLD_DAYS = (45, 20, 15)
+_PHASE_LOSS_EXIT = (-0.10, -0.03, -0.12)
+_PHASE_ATR_MULT = (2.0, 1.2, 2.2)
+_PHASE_PYRAMID_LIMIT = (2, 1, 1)
+
+
 def run_v12_backtest(
     data: pd.DataFrame,
     start_date: str,
@@ -379,7 +775,9 @@ def run_v12_backtest(
     start_ts = pd.to_datetime(start_date)
     end_ts = pd.to_datetime(end_date)
     mask = (prepared["date"] >= start_ts) & (prepared["date"] <= end_ts)
-    backtest_data = prepared.loc[mask].copy()
+    # Stable, so rows of one date keep their (ticker, time) order; each day is
+    # then a contiguous slice rather than a per-day copy from groupby.
+    backtest_data = prepared.loc[mask].sort_values("date", kind="stable")
     if backtest_data.empty:
         return []
 
@@ -401,7 +799,9 @@ def run_v12_backtest(
     pivoted_sma_50 = tables["pivoted_sma_50"]
     pivoted_macd = tables["pivoted_macd"]
 
-    daily_groups = dict(tuple(backtest_data.groupby("date")))
+    day_keys = pd.DatetimeIndex(backtest_data["date"]).asi8
+    day_starts = np.flatnonzero(np.r_[True, day_keys[1:] != day_keys[:-1]])
+    day_bounds = np.append(day_starts, len(day_keys))
     market_cols = [
         "market_close",
         "market_MA50",
@@ -411,76 +811,114 @@ def run_v12_backtest(
         "market_boll_width",
     ]
     market_context = backtest_data.drop_duplicates("date")[["date", *market_cols]].set_index("date").sort_index()
+    # One float row per day instead of a Series built by .loc[] on every iteration.
+    market_arr = market_context.to_numpy(dtype=np.float64)
+    market_idx = {date: i for i, date in enumerate(market_context.index)}
+    # Regime per day, evaluated for all days at once; the loop only indexes it.
+    market_close, market_ma50, market_ma200, market_rsi, market_adx, market_boll_width = market_arr.T
+    bull_days = (market_close > market_ma50) & (market_close > market_ma200) & (market_rsi > 50)
+    sideway_days = (market_adx < 20) & (market_boll_width < 0.4) & (market_rsi >= 40) & (market_rsi <= 60)
+    bear_days = ((market_close < market_ma200) | (market_rsi < 30)).tolist()
+    phase_codes = np.where(bull_days, 0, np.where(sideway_days, 1, 2)).tolist()
 
     working_capital = float(initial_capital)
     reserve_capital = float(base_capital) - working_capital
-    current_portfolio: Dict[str, Dict[str, object]] = {}
-    pending_settlements: deque[Tuple[pd.Timestamp, float]] = deque()
+    current_portfolio: Dict[str, _Position] = {}
+    # FIFO of (settlement day index, amount): day indices compare as plain ints,
+    # and a head pointer replaces popping. Entries are released in append order.
+    settle_days: List[int] = []
+    settle_amounts: List[float] = []
+    settle_head = 0
     trades: List[Dict[str, object]] = []
 
-    all_dates = sorted(daily_groups.keys())
+    all_dates = list(backtest_data["date"].iloc[day_starts])
     date_to_idx = {date: idx for idx, date in enumerate(all_dates)}
 
+    # The day loop reads these by (date, ticker) for every open position; plain
+    # 2-D arrays on one shared dates x tickers grid turn each .at[] label lookup
+    # into direct indexing. Cells a pivot lacks read as NaN.
+    ticker_cols = pivoted_close.columns if pivoted_close is not None else pd.Index([])
+    ticker_to_col = {ticker: col for col, ticker in enumerate(ticker_cols)}
+    close_arr = _as_grid(pivoted_close, all_dates, ticker_cols)
+    open_arr = _as_grid(pivoted_open, all_dates, ticker_cols)
+    high_arr = _as_grid(pivoted_high, all_dates, ticker_cols)
+    low_arr = _as_grid(pivoted_low, all_dates, ticker_cols)
+    rsi_arr = _as_grid(pivoted_rsi, all_dates, ticker_cols)
+    mfi_arr = _as_grid(pivoted_mfi, all_dates, ticker_cols)
+    obv_arr = _as_grid(pivoted_obv, all_dates, ticker_cols)
+    sma5_arr = _as_grid(pivoted_sma_5, all_dates, ticker_cols)
+    sma50_arr = _as_grid(pivoted_sma_50, all_dates, ticker_cols)
+    boll_upper_arr = _as_grid(pivoted_boll_upper, all_dates, ticker_cols)
+    boll_lower_arr = _as_grid(pivoted_boll_lower, all_dates, ticker_cols)
+    volume_arr = _as_grid(pivoted_volume, all_dates, ticker_cols)
+    nan_row = np.full(len(ticker_cols), np.nan)
+
     for idx, current_date in enumerate(all_dates):
-        while pending_settlements and pending_settlements[0][0] <= current_date:
-            _, amount = pending_settlements.popleft()
-            working_capital += amount
-
-        market_row = market_context.loc[current_date]
-        market_close = market_row["market_close"]
-        market_ma50 = market_row["market_MA50"]
-        market_ma200 = market_row["market_MA200"]
-        market_rsi = market_row["market_rsi"]
-        market_adx = market_row["market_adx"]
-        market_boll_width = market_row["market_boll_width"]
-
-        is_bull = (market_close > market_ma50) and (market_close > market_ma200) and (market_rsi > 50)
-        is_sideway = (market_adx < 20) and (market_boll_width < 0.4) and (40 <= market_rsi <= 60)
-        is_bear = (market_close < market_ma200) or (market_rsi < 30)
-
-        market_phase = "bull" if is_bull else "sideway" if is_sideway else "bear"
-        position_multiplier = 1.2 if is_bull else 0.5 if is_sideway else 0.0
-        max_hold_days = 45 if is_bull else 20 if is_sideway else 15
-        loss_exit_threshold = -0.10 if is_bull else -0.03 if is_sideway else -0.12
-        atr_mult = 2.0 if is_bull else 1.2 if is_sideway else 2.2
-        pyramid_limit_phase = 2 if is_bull else 1
+        while settle_head < len(settle_days) and settle_days[settle_head] <= idx:
+            working_capital += settle_amounts[settle_head]
+            settle_head += 1
+
+        market_row = market_idx[current_date]
+        phase = phase_codes[market_row]
+        is_bear = bear_days[market_row]
+        market_phase = _MARKET_PHASES[phase]
+        position_multiplier = _PHASE_POSITION_MULTIPLIER[phase]
+        max_hold_days = _PHASE_MAX_HOLD_DAYS[phase]
+        loss_exit_threshold = _PHASE_LOSS_EXIT[phase]
+        atr_mult = _PHASE_ATR_MULT[phase]
+        pyramid_limit_phase = _PHASE_PYRAMID_LIMIT[phase]
 
         positions_to_remove: List[str] = []
+        if current_portfolio:
+            # Bind today's row of every grid once; each position then reads
+            # its column. Missing pivots read as NaN (sma_* fall back to close).
+            close_row = close_arr[idx]
+            open_row = open_arr[idx] if open_arr is not None else nan_row
+            high_row = high_arr[idx] if high_arr is not None else nan_row
+            low_row = low_arr[idx] if low_arr is not None else nan_row
+            rsi_row = rsi_arr[idx] if rsi_arr is not None else nan_row
+            mfi_row = mfi_arr[idx] if mfi_arr is not None else nan_row
+            obv_row = obv_arr[idx] if obv_arr is not None else nan_row
+            prev_obv_row = obv_arr[idx - 1] if obv_arr is not None and idx > 0 else nan_row
+            sma5_row = sma5_arr[idx] if sma5_arr is not None else close_row
+            sma50_row = sma50_arr[idx] if sma50_arr is not None else close_row
+            volume_row = volume_arr[idx] if volume_arr is not None else nan_row
         for ticker, pos in list(current_portfolio.items()):
-            if pivoted_close is None or ticker not in pivoted_close.columns:
+            col = ticker_to_col.get(ticker)
+            if col is None:
                 continue
 
-            open_val = pivoted_open.at[current_date, ticker] if pivoted_open is not None else np.nan
-            high_val = pivoted_high.at[current_date, ticker] if pivoted_high is not None else np.nan
-            low_val = pivoted_low.at[current_date, ticker] if pivoted_low is not None else np.nan
-            close_val = pivoted_close.at[current_date, ticker]
-            rsi_val = pivoted_rsi.at[current_date, ticker] if pivoted_rsi is not None else np.nan
-            mfi_val = pivoted_mfi.at[current_date, ticker] if pivoted_mfi is not None else np.nan
-            obv_val = pivoted_obv.at[current_date, ticker] if pivoted_obv is not None else np.nan
-            sma5_val = pivoted_sma_5.at[current_date, ticker] if pivoted_sma_5 is not None else close_val
-            sma50_val = pivoted_sma_50.at[current_date, ticker] if pivoted_sma_50 is not None else close_val
-
-            if pd.isna(close_val):
+            open_val = open_row[col]
+            high_val = high_row[col]
+            low_val = low_row[col]
+            close_val = close_row[col]
+            rsi_val = rsi_row[col]
+            mfi_val = mfi_row[col]
+            obv_val = obv_row[col]
+            sma5_val = sma5_row[col]
+            sma50_val = sma50_row[col]
+
+            if math.isnan(close_val):
                 continue
 
-            holding_days = int((current_date - pos["entry_date"]).days)
-            tp = pos["tp"]
-            sl = pos["sl"]
-            trailing_sl = pos.get("trailing_sl", pos["entry_price"] * (1 - trailing_stop_pct))
-            highest_price = pos.get("highest_price", pos["entry_price"])
+            holding_days = int((current_date - pos.entry_date).days)
+            tp = pos.tp
+            sl = pos.sl
+            trailing_sl = pos.trailing_sl
+            highest_price = pos.highest_price
 
             if high_val > highest_price:
                 highest_price = high_val
                 trailing_sl = highest_price * (1 - trailing_stop_pct)
-                pos["highest_price"] = highest_price
-                pos["trailing_sl"] = trailing_sl
+                pos.highest_price = highest_price
+                pos.trailing_sl = trailing_sl
 
-            if market_phase == "sideway" and pivoted_boll_upper is not None and pivoted_boll_lower is not None:
-                upper = pivoted_boll_upper.at[current_date, ticker]
-                lower = pivoted_boll_lower.at[current_date, ticker]
-                if not pd.isna(upper):
+            if market_phase == "sideway" and boll_upper_arr is not None and boll_lower_arr is not None:
+                upper = boll_upper_arr[idx, col]
+                lower = boll_lower_arr[idx, col]
+                if not math.isnan(upper):
                     tp = min(tp, upper)
-                if not pd.isna(lower):
+                if not math.isnan(lower):
                     sl = max(sl, lower)
 
             trigger_tp = False
@@ -489,38 +927,35 @@ def run_v12_backtest(
             partial_exit = False
             exit_type = "Normal"
 
-            if not pd.isna(open_val) and holding_days >= min_holding_days:
+            if not math.isnan(open_val) and holding_days >= min_holding_days:
                 if open_val >= tp:
                     trigger_tp = True
                     exit_price = open_val
                     partial_exit = True
-                    exit_type = "Pyramid" if pos.get("pyramid_count", 0) > 0 else "Normal"
+                    exit_type = "Pyramid" if pos.pyramid_count > 0 else "Normal"
                 elif open_val <= min(sl, trailing_sl):
                     trigger_sl = True
                     exit_price = open_val
                     exit_type = "Normal"
 
             if exit_price is None and holding_days >= min_holding_days:
-                if not pd.isna(high_val) and high_val >= tp:
+                if not math.isnan(high_val) and high_val >= tp:
                     trigger_tp = True
                     exit_price = close_val
                     partial_exit = True
-                    exit_type = "Pyramid" if pos.get("pyramid_count", 0) > 0 else "Normal"
-                elif not pd.isna(low_val) and low_val <= min(sl, trailing_sl):
+                    exit_type = "Pyramid" if pos.pyramid_count > 0 else "Normal"
+                elif not math.isnan(low_val) and low_val <= min(sl, trailing_sl):
                     trigger_sl = True
                     exit_price = close_val
                     exit_type = "Normal"
 
-            prev_obv = np.nan
-            if idx > 0 and pivoted_obv is not None and ticker in pivoted_obv.columns:
-                prev_date = all_dates[idx - 1]
-                prev_obv = pivoted_obv.at[prev_date, ticker]
+            prev_obv = prev_obv_row[col]
             is_weak = (
-                (not pd.isna(rsi_val) and rsi_val < 30) and
-                (not pd.isna(mfi_val) and mfi_val < 20) and
-                (not pd.isna(obv_val) and obv_val < prev_obv)
+                (not math.isnan(rsi_val) and rsi_val < 30) and
+                (not math.isnan(mfi_val) and mfi_val < 20) and
+                (not math.isnan(obv_val) and obv_val < prev_obv)
             )
-            current_profit_pct = close_val / pos["entry_price"] - 1
+            current_profit_pct = close_val / pos.entry_price - 1
             trigger_end = (
                 holding_days >= max_hold_days or
                 is_weak or
@@ -541,35 +976,35 @@ def run_v12_backtest(
                 market_phase == "bull" and
                 2 <= holding_days <= 10 and
                 0.05 < current_profit_pct < 0.10 and
-                pos.get("pyramid_count", 0) < pyramid_limit_phase
+                pos.pyramid_count < pyramid_limit_phase
             ):
-                add_shares = int(pos["shares"] * 0.2 / lot_size) * lot_size
+                add_shares = int(pos.shares * 0.2 / lot_size) * lot_size
                 add_cost = add_shares * close_val * (1 + commission_buy)
                 if add_shares >= lot_size and working_capital >= add_cost:
                     new_avg_cost = (
-                        pos["shares"] * pos["avg_cost"] + add_shares * close_val
-                    ) / (pos["shares"] + add_shares)
-                    pos["avg_cost"] = new_avg_cost
-                    pos["shares"] += add_shares
-                    pos["pyramid_count"] = pos.get("pyramid_count", 0) + 1
-                    pos["tp"] = close_val * 1.12
-                    pos["trailing_sl"] = close_val * (1 - trailing_stop_pct * 0.7)
+                        pos.shares * pos.avg_cost + add_shares * close_val
+                    ) / (pos.shares + add_shares)
+                    pos.avg_cost = new_avg_cost
+                    pos.shares += add_shares
+                    pos.pyramid_count += 1
+                    pos.tp = close_val * 1.12
+                    pos.trailing_sl = close_val * (1 - trailing_stop_pct * 0.7)
                     pyramid_triggered = True
                     working_capital -= add_cost
             if (trigger_tp or trigger_sl or trigger_end) and holding_days >= min_holding_days and not pyramid_triggered:
                 if trigger_end and exit_price is None:
                     exit_price = close_val
-                    exit_type = "Pyramid" if pos.get("pyramid_count", 0) > 0 else "Normal"
+                    exit_type = "Pyramid" if pos.pyramid_count > 0 else "Normal"
 
-                volume_today = pivoted_volume.at[current_date, ticker] if pivoted_volume is not None and ticker in pivoted_volume.columns else np.nan
-                shares = pos["shares"]
+                volume_today = volume_row[col]
+                shares = pos.shares
                 shares_to_sell = shares
                 if trigger_tp and partial_exit:
                     shares_to_sell = int(shares * partial_profit_pct / lot_size) * lot_size
                 shares_to_sell = max(lot_size if shares >= lot_size else shares, shares_to_sell)
 
                 can_sell_today = (
-                    not pd.isna(volume_today) and volume_today > 0 and
+                    not math.isnan(volume_today) and volume_today > 0 and
                     shares_to_sell <= volume_today * liquidity_threshold
                 )
 
@@ -580,9 +1015,9 @@ def run_v12_backtest(
                     while next_idx < len(all_dates) - 1:
                         next_idx += 1
                         next_date = all_dates[next_idx]
-                        if (next_date - pos["entry_date"]).days >= min_holding_days:
-                            next_open = pivoted_open.at[next_date, ticker] if pivoted_open is not None else np.nan
-                            if not pd.isna(next_open):
+                        if (next_date - pos.entry_date).days >= min_holding_days:
+                            next_open = open_arr[next_idx, col] if open_arr is not None else np.nan
+                            if not math.isnan(next_open):
                                 use_exit_price = next_open
                                 exit_date = next_date
                                 break
@@ -596,19 +1031,19 @@ def run_v12_backtest(
                     continue
 
                 settlement_idx = date_to_idx.get(exit_date, idx) + 2
-                settlement_date = all_dates[min(settlement_idx, len(all_dates) - 1)]
-                pending_settlements.append((settlement_date, net_proceeds))
+                settle_days.append(min(settlement_idx, len(all_dates) - 1))
+                settle_amounts.append(net_proceeds)
 
-                holding_days_exit = int((exit_date - pos["entry_date"]).days)
+                holding_days_exit = int((exit_date - pos.entry_date).days)
                 if holding_days_exit < min_holding_days:
                     continue
 
-                profit = net_proceeds - (shares_to_sell * pos["avg_cost"] * (1 + commission_buy))
+                profit = net_proceeds - (shares_to_sell * pos.avg_cost * (1 + commission_buy))
                 trades.append({
                     "ticker": ticker,
-                    "entry_date": pos["entry_date"],
+                    "entry_date": pos.entry_date,
                     "exit_date": exit_date,
-                    "entry_price": pos["entry_price"],
+                    "entry_price": pos.entry_price,
                     "exit_price": use_exit_price,
                     "shares": shares_to_sell,
                     "profit": profit,
@@ -617,16 +1052,16 @@ def run_v12_backtest(
                 })
 
                 if partial_exit and trigger_tp and shares_to_sell < shares:
-                    pos["shares"] -= shares_to_sell
-                    pos["tp"] = use_exit_price * 1.15
-                    pos["sl"] = max(pos["sl"], use_exit_price * (1 - trailing_stop_pct * 1.2))
+                    pos.shares -= shares_to_sell
+                    pos.tp = use_exit_price * 1.15
+                    pos.sl = max(pos.sl, use_exit_price * (1 - trailing_stop_pct * 1.2))
                 else:
                     positions_to_remove.append(ticker)
 
         for ticker in positions_to_remove:
             current_portfolio.pop(ticker, None)
 
-        day_frame = daily_groups[current_date]
+        day_frame = backtest_data.iloc[day_bounds[idx]:day_bounds[idx + 1]]
         candidates = screen_candidates_v12(
             day_frame,
             min_volume_ma20=min_volume_ma20,
@@ -675,61 +1110,67 @@ def run_v12_backtest(
                 continue
 
             working_capital -= actual_cost
-            current_portfolio[ticker] = {
-                "shares": actual_shares,
-                "entry_price": entry_price,
-                "avg_cost": entry_price,
-                "tp": entry_price + (atr_mult * row["atr_14"]),
-                "sl": entry_price - (atr_mult * row["atr_14"]),
-                "trailing_sl": entry_price * (1 - trailing_stop_pct),
-                "highest_price": entry_price,
-                "end_date": current_date + pd.Timedelta(days=max_hold_days),
-                "entry_date": current_date,
-                "pyramid_count": 0,
-            }
+            current_portfolio[ticker] = _Position(
+                shares=actual_shares,
+                entry_price=entry_price,
+                avg_cost=entry_price,
+                tp=entry_price + (atr_mult * row["atr_14"]),
+                sl=entry_price - (atr_mult * row["atr_14"]),
+                trailing_sl=entry_price * (1 - trailing_stop_pct),
+                highest_price=entry_price,
+                entry_date=current_date,
+            )
             executed += 1
             if executed >= slots_available:
                 break
 
     return trades
 
+def _format_days(days: pd.Series) -> pd.Series | np.ndarray:
+    """``days.dt.strftime("%Y-%m-%d")`` for normalized stamps, via numpy's ISO formatter when naive."""
+    if days.dt.tz is not None or days.isna().any():
+        return days.dt.strftime("%Y-%m-%d")
+    return np.datetime_as_string(days.to_numpy(), unit="D").astype(object)
+
+
 def trades_to_signal_frame(trades: Iterable[Dict[str, object]]) -> pd.DataFrame:
-    records: List[Dict[str, object]] = []
-    for trade in trades:
-        entry_date = pd.to_datetime(trade["entry_date"]).normalize()
-        exit_date = pd.to_datetime(trade["exit_date"]).normalize()
-        shares = int(trade["shares"])
-        entry_price = float(trade["entry_price"])
-        exit_price = float(trade["exit_price"])
-        profit = float(trade["profit"])
-        profit_pct = (exit_price / entry_price - 1) if entry_price else np.nan
-
-        records.append({
-            "date": entry_date,
-            "signal_type": "BUY_NEW",
-            "ticker": trade["ticker"],
-            "price": entry_price,
-            "shares": shares,
-            "holding_days": trade["holding_days"],
-            "exit_type": "",
-            "profit": np.nan,
-            "profit_pct": np.nan,
-        })
-        records.append({
-            "date": exit_date,
-            "signal_type": "SELL",
-            "ticker": trade["ticker"],
-            "price": exit_price,
-            "shares": shares,
-            "holding_days": trade["holding_days"],
-            "exit_type": trade["exit_type"],
-            "profit": profit,
-            "profit_pct": profit_pct,
-        })
-
-    frame = pd.DataFrame.from_records(records)
-    if frame.empty:
-        return frame
+    """One BUY_NEW and one SELL row per trade, sorted by date, type and ticker."""
+    td = pd.DataFrame(list(trades))
+    if td.empty:
+        return pd.DataFrame.from_records([])
+
+    # Build both halves column-wise, then interleave them (buy, sell, buy, ...)
+    # so rows tied on the sort keys keep the per-trade order.
+    entry_price = td["entry_price"].to_numpy(dtype=np.float64)
+    exit_price = td["exit_price"].to_numpy(dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        profit_pct = np.where(entry_price != 0, exit_price / entry_price - 1, np.nan)
+    shares = td["shares"].astype(np.int64)
+    n = len(td)
+    buys = pd.DataFrame({
+        "date": pd.to_datetime(td["entry_date"]).dt.normalize(),
+        "signal_type": "BUY_NEW",
+        "ticker": td["ticker"],
+        "price": entry_price,
+        "shares": shares,
+        "holding_days": td["holding_days"],
+        "exit_type": "",
+        "profit": np.nan,
+        "profit_pct": np.nan,
+    })
+    sells = pd.DataFrame({
+        "date": pd.to_datetime(td["exit_date"]).dt.normalize(),
+        "signal_type": "SELL",
+        "ticker": td["ticker"],
+        "price": exit_price,
+        "shares": shares,
+        "holding_days": td["holding_days"],
+        "exit_type": td["exit_type"],
+        "profit": td["profit"].to_numpy(dtype=np.float64),
+        "profit_pct": profit_pct,
+    })
+    interleaved = np.column_stack([np.arange(n), np.arange(n) + n]).ravel()
+    frame = pd.concat([buys, sells], ignore_index=True).iloc[interleaved]
     frame = frame.sort_values(["date", "signal_type", "ticker"]).reset_index(drop=True)
-    frame["date"] = frame["date"].dt.strftime("%Y-%m-%d")
+    frame["date"] = _format_days(frame["date"])
     return frame
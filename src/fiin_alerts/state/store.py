@@ -1,27 +1,193 @@
 from __future__ import annotations
-import sqlite3, pathlib, datetime as dt
-from typing import Iterable
+import atexit, json, queue, sqlite3, pathlib, threading, datetime as dt
+from contextlib import contextmanager
+from typing import Iterable, Iterator
 
 from src.fiin_alerts.config import ALERT_DB_PATH
 
 DB = pathlib.Path(ALERT_DB_PATH)
 
-def _conn():
-    c = sqlite3.connect(str(DB))
-    c.execute("""CREATE TABLE IF NOT EXISTS sent(
-        k TEXT PRIMARY KEY,
-        ts TEXT NOT NULL
-    )""")
+# The scheduler keeps one process alive all day, so reuse a single connection
+# instead of paying connect + schema check + fsync on every dedup lookup.
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+)
+# Fixed statement text lets sqlite3's per-connection statement cache reuse the
+# prepared statements instead of re-parsing SQL on every call.
+# WITHOUT ROWID keeps the key in the table's own B-tree, so each key is stored
+# once rather than in both the rowid table and a separate PK index.
+_SQL_CREATE = """CREATE TABLE IF NOT EXISTS sent(
+    k TEXT PRIMARY KEY,
+    ts TEXT NOT NULL
+) WITHOUT ROWID"""
+_SQL_TABLE_DDL = "SELECT sql FROM sqlite_master WHERE type='table' AND name='sent'"
+_SQL_CREATE_TS_INDEX = "CREATE INDEX IF NOT EXISTS ix_sent_ts ON sent(ts)"
+_SQL_ALREADY_SENT = "SELECT 1 FROM sent WHERE k=?"
+# The whole key list is bound as one JSON array parameter, so the statement
+# text never changes with the batch size and stays in the statement cache.
+_SQL_ALREADY_SENT_MANY = "SELECT k FROM sent WHERE k IN (SELECT value FROM json_each(?))"
+# Fallback for SQLite builds without JSON1 (bundled with SQLite >= 3.38).
+_SQL_ALREADY_SENT_IN = "SELECT k FROM sent WHERE k IN ({})"
+_SQL_MARK_SENT = "INSERT OR IGNORE INTO sent(k, ts) VALUES(?,?)"
+# Stay well below SQLITE_MAX_VARIABLE_NUMBER on older builds (999).
+_MAX_PARAMS = 500
+
+# One writer guarded by _LOCK, plus a few read-only connections. In WAL mode
+# readers never wait on the writer, so dedup lookups from concurrent scheduler
+# jobs do not queue behind an in-flight mark_sent().
+_LOCK = threading.RLock()
+_CONN: sqlite3.Connection | None = None
+_READER_POOL_SIZE = 4
+_READERS: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+
+# In-process mirror of every sent key, so the common "new alert" lookup is a
+# set probe instead of a query. PRAGMA data_version on the writer connection
+# changes only when *another* connection commits (e.g. a second process), which
+# triggers a reload; our own keys are added once their transaction commits.
+_SQL_ALL_KEYS = "SELECT k FROM sent"
+_KNOWN: set[str] | None = None
+_KNOWN_VERSION = -1
+_UNCOMMITTED: list[str] = []
+
+def _conn() -> sqlite3.Connection:
+    global _CONN
+    with _LOCK:
+        if _CONN is None:
+            c = sqlite3.connect(str(DB), timeout=30, check_same_thread=False, isolation_level=None)
+            for pragma in _PRAGMAS:
+                c.execute(pragma)
+            _migrate(c)
+            c.execute(_SQL_CREATE)
+            c.execute(_SQL_CREATE_TS_INDEX)
+            _CONN = c
+        return _CONN
+
+def _migrate(c: sqlite3.Connection) -> None:
+    """Rebuild a pre-existing rowid ``sent`` table as WITHOUT ROWID, keeping rows."""
+    row = c.execute(_SQL_TABLE_DDL).fetchone()
+    if row is None or "WITHOUT ROWID" in row[0].upper():
+        return
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        c.execute("ALTER TABLE sent RENAME TO sent_old")
+        c.execute("DROP INDEX IF EXISTS ix_sent_ts")
+        c.execute(_SQL_CREATE)
+        c.execute("INSERT OR IGNORE INTO sent(k, ts) SELECT k, ts FROM sent_old")
+        c.execute("DROP TABLE sent_old")
+    except BaseException:
+        c.execute("ROLLBACK")
+        raise
+    c.execute("COMMIT")
+
+def _open_reader() -> sqlite3.Connection:
+    _conn()  # the writer creates the file and schema before any reader opens
+    c = sqlite3.connect(f"{DB.resolve().as_uri()}?mode=ro", uri=True, timeout=30, check_same_thread=False)
+    c.execute("PRAGMA busy_timeout=5000")
     return c
 
+@contextmanager
+def _read_conn() -> Iterator[sqlite3.Connection]:
+    """Check a read-only connection out of the pool; it sees committed data only."""
+    try:
+        c = _READERS.get_nowait()
+    except queue.Empty:
+        c = _open_reader()
+    try:
+        yield c
+    finally:
+        if _READERS.qsize() < _READER_POOL_SIZE:
+            _READERS.put(c)
+        else:
+            c.close()
+
+def _known_keys(c: sqlite3.Connection) -> set[str]:
+    """The mirrored key set, reloaded if another connection wrote; hold _LOCK."""
+    global _KNOWN, _KNOWN_VERSION
+    version = c.execute("PRAGMA data_version").fetchone()[0]
+    if _KNOWN is None or version != _KNOWN_VERSION:
+        _KNOWN = {k for (k,) in c.execute(_SQL_ALL_KEYS)}
+        _KNOWN_VERSION = version
+    return _KNOWN
+
+def close() -> None:
+    global _CONN, _KNOWN
+    with _LOCK:
+        _KNOWN = None
+        _UNCOMMITTED.clear()
+        while True:
+            try:
+                _READERS.get_nowait().close()
+            except queue.Empty:
+                break
+        if _CONN is not None:
+            _CONN.close()
+            _CONN = None
+
+atexit.register(close)
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Run a group of writes as one BEGIN IMMEDIATE ... COMMIT (a single sync).
+
+    Nested use joins the outer transaction, so a notify run can wrap several
+    store writes and still pay for one commit.
+    """
+    with _LOCK:
+        c = _conn()
+        if c.in_transaction:
+            yield c
+            return
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            yield c
+        except BaseException:
+            c.execute("ROLLBACK")
+            _UNCOMMITTED.clear()
+            raise
+        c.execute("COMMIT")
+        if _KNOWN is not None:
+            _KNOWN.update(_UNCOMMITTED)
+        _UNCOMMITTED.clear()
+
 def already_sent(key: str) -> bool:
-    c = _conn()
-    row = c.execute("SELECT 1 FROM sent WHERE k=?", (key,)).fetchone()
-    c.close()
+    with _read_conn() as c:
+        row = c.execute(_SQL_ALREADY_SENT, (key,)).fetchone()
     return row is not None
 
+def already_sent_many(keys: Iterable[str]) -> set[str]:
+    """Return the subset of ``keys`` already recorded, in a single query."""
+    pending = list(dict.fromkeys(keys))
+    if not pending:
+        return set()
+    # Answer from the mirror unless a write is in flight; never wait behind it.
+    if _LOCK.acquire(blocking=False):
+        try:
+            c = _conn()
+            if not c.in_transaction:
+                known = _known_keys(c)
+                return {k for k in pending if k in known}
+        finally:
+            _LOCK.release()
+    with _read_conn() as c:
+        try:
+            return {k for (k,) in c.execute(_SQL_ALREADY_SENT_MANY, (json.dumps(pending),))}
+        except sqlite3.OperationalError:  # no json_each in this SQLite build
+            found: set[str] = set()
+            for i in range(0, len(pending), _MAX_PARAMS):
+                chunk = pending[i:i + _MAX_PARAMS]
+                sql = _SQL_ALREADY_SENT_IN.format(",".join("?" * len(chunk)))
+                found.update(k for (k,) in c.execute(sql, chunk))
+            return found
+
 def mark_sent(keys: Iterable[str]) -> None:
     now = dt.datetime.utcnow().isoformat()
-    c = _conn()
-    c.executemany("INSERT OR REPLACE INTO sent(k, ts) VALUES(?,?)", [(k, now) for k in keys])
-    c.commit(); c.close()
+    rows = [(k, now) for k in keys]
+    if not rows:
+        return
+    with transaction() as c:
+        c.executemany(_SQL_MARK_SENT, rows)
+        _UNCOMMITTED.extend(k for k, _ in rows)